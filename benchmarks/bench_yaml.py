@@ -0,0 +1,70 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare parsing fiaas configs with the libyaml loader and the pure-Python loader
+
+    $ python benchmarks/bench_yaml.py --ingress 50 --env 200 --number 200
+"""
+
+import argparse
+import json
+import timeit
+
+import yaml
+
+
+def make_config(ingress, env):
+    config = {
+        "version": 3,
+        "replicas": {"minimum": 2, "maximum": 10, "cpu_threshold_percentage": 75},
+        "resources": {"requests": {"cpu": "200m", "memory": "256Mi"}, "limits": {"cpu": "1", "memory": "512Mi"}},
+        "ports": [{"name": "http", "protocol": "http", "port": 80, "target_port": 8080}],
+        "healthchecks": {"liveness": {"http": {"path": "/_/health"}}, "readiness": {"http": {"path": "/_/ready"}}},
+        "metrics": {"prometheus": {"path": "/_/metrics"}},
+        "ingress": [
+            {"host": "app{}.example.com".format(i), "paths": [{"path": "/api/v{}".format(i), "port": "http"}]}
+            for i in range(ingress)
+        ],
+        "extensions": {"strongbox": {"groups": ["group-a", "group-b"]}},
+        "annotations": {"deployment": {"example.com/owner": "team"}},
+        "config": {"envs": {"ENV_VAR_{}".format(i): "value number {}".format(i) for i in range(env)}},
+    }
+    return yaml.safe_dump(config, default_flow_style=False).encode("utf-8")
+
+
+def run(data, loader, number):
+    seconds = min(timeit.repeat(lambda: yaml.load(data, Loader=loader), number=number, repeat=3))
+    return seconds / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ingress", type=int, default=20, help="Number of ingress entries in the config")
+    parser.add_argument("--env", type=int, default=100, help="Number of environment variables in the config")
+    parser.add_argument("--number", type=int, default=100, help="Number of parses per measurement")
+    args = parser.parse_args()
+
+    data = make_config(args.ingress, args.env)
+    results = {"config_bytes": len(data), "python_seconds": run(data, yaml.SafeLoader, args.number)}
+    if hasattr(yaml, "CSafeLoader"):
+        results["libyaml_seconds"] = run(data, yaml.CSafeLoader, args.number)
+        results["speedup"] = results["python_seconds"] / results["libyaml_seconds"]
+    else:
+        results["libyaml_seconds"] = None
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
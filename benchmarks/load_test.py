@@ -0,0 +1,260 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure mast under concurrent load, against local stand-ins for Artifactory and the apiserver
+
+Starts the stubs from stubs.py and a mast server pointing at them, then sends requests to each endpoint at a fixed
+rate for a while, and prints latency percentiles and throughput per endpoint as JSON:
+
+    $ python benchmarks/load_test.py --server asyncio --rate 50 --duration 30 --config-latency 0.05
+
+Requests are sent on schedule whether or not earlier ones have finished, and latency is counted from the scheduled
+time, so a server that falls behind shows it in the percentiles.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+from stubs import Apiserver, Artifactory
+
+ENDPOINTS = ("deploy", "status", "generate_application", "generate_configmap")
+NAMESPACE = "load-test"
+# Talisman redirects plain HTTP requests to https
+HEADERS = {"X-Forwarded-Proto": "https"}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start(app):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, "http://127.0.0.1:{}".format(port)
+
+
+def start_mast(args, artifactory_url, apiserver_url):
+    port = free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               SERVER=args.server,
+               APISERVER_URL=apiserver_url,
+               APISERVER_TOKEN="load-test",
+               ARTIFACTORY_USER="load-test",
+               ARTIFACTORY_PWD="load-test",
+               ARTIFACTORY_ORIGIN=artifactory_url,
+               URL_SCHEME="http",
+               STATUS_CACHE=str(args.status_cache).lower())
+    if args.server == "production":
+        env.update(SERVER_WORKERS=str(args.workers), SERVER_THREADS=str(args.threads))
+    output = None if args.verbose else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, "-m", "fiaas_mast"], env=env, stdout=output, stderr=output)
+    return process, "http://127.0.0.1:{}".format(port)
+
+
+async def wait_until_healthy(session, url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("mast exited with {}".format(process.returncode))
+        try:
+            async with session.get(url + "/health", headers=HEADERS) as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("mast did not become healthy in {} seconds".format(timeout))
+
+
+class Requests(object):
+    """Builds the requests for each endpoint"""
+
+    def __init__(self, mast_url, artifactory_url, applications, seeded):
+        self.mast_url = mast_url
+        self.artifactory_url = artifactory_url
+        self.applications = applications
+        self.seeded = seeded
+        self.deploys = 0
+
+    def _application(self):
+        return "app-{}".format(random.randrange(self.applications))
+
+    def _config_url(self, application):
+        return "{}/configs/{}.yml".format(self.artifactory_url, application)
+
+    def deploy(self):
+        # A new image each time, so deploys are not collapsed as repeats of earlier ones
+        self.deploys += 1
+        application = self._application()
+        return "POST", "/deploy/", {"application_name": application,
+                                    "image": "example/{}:{}".format(application, self.deploys),
+                                    "config_url": self._config_url(application), "namespace": NAMESPACE}
+
+    def status(self):
+        application, deployment_id = random.choice(self.seeded)
+        return "GET", "/status/{}/{}/{}/".format(NAMESPACE, application, deployment_id), None
+
+    def generate_application(self):
+        method, _, body = self.deploy()
+        return method, "/generate/application", body
+
+    def generate_configmap(self):
+        application = self._application()
+        return "POST", "/generate/configmap", {"application_name": application, "namespace": NAMESPACE,
+                                               "application_data_url": self._config_url(application)}
+
+
+async def drive(session, mast_url, make_request, rate, duration):
+    """Send make_request() every 1/rate seconds for duration seconds, returning (latency, status) of each"""
+    loop = asyncio.get_running_loop()
+    results = []
+
+    async def send(scheduled):
+        method, path, body = make_request()
+        try:
+            async with session.request(method, mast_url + path, json=body, headers=HEADERS) as resp:
+                await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        results.append((loop.time() - scheduled, status))
+
+    start_time = loop.time()
+    tasks = []
+    for i in range(int(rate * duration)):
+        scheduled = start_time + i / rate
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        tasks.append(asyncio.ensure_future(send(scheduled)))
+    await asyncio.gather(*tasks)
+    return results, loop.time() - start_time
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(values) + 0.5)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(results, elapsed):
+    latencies = sorted(latency for latency, _ in results)
+    codes = {}
+    for _, status in results:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+    errors = sum(count for code, count in codes.items() if not (code.isdigit() and int(code) < 400))
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "status_codes": codes,
+        "throughput": len(results) / elapsed if elapsed else None,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+        },
+    }
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip().decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    artifactory = Artifactory(args.config_latency, args.config_jitter, args.config_bytes)
+    apiserver = Apiserver(args.apiserver_latency, args.apiserver_jitter)
+    seeded = [("app-{}".format(i), "seed-{}".format(i)) for i in range(args.applications)]
+    for application, deployment_id in seeded:
+        apiserver.seed_status(NAMESPACE, application, deployment_id)
+    artifactory_runner, artifactory_url = await start(artifactory.app)
+    apiserver_runner, apiserver_url = await start(apiserver.app)
+    process, mast_url = start_mast(args, artifactory_url, apiserver_url)
+    connector = aiohttp.TCPConnector(limit=0)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+            await wait_until_healthy(session, mast_url, process)
+            requests = Requests(mast_url, artifactory_url, args.applications, seeded)
+            endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+            runs = [drive(session, mast_url, getattr(requests, endpoint), args.rate, args.duration)
+                    for endpoint in endpoints]
+            outcomes = await asyncio.gather(*runs)
+    finally:
+        process.terminate()
+        process.wait()
+        await artifactory_runner.cleanup()
+        await apiserver_runner.cleanup()
+    return {
+        "commit": commit(),
+        "parameters": vars(args),
+        "endpoints": {endpoint: summarize(results, elapsed)
+                      for endpoint, (results, elapsed) in zip(endpoints, outcomes)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("development", "production", "asyncio"), default="production",
+                        help="Serving mode of mast")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes in production mode")
+    parser.add_argument("--threads", type=int, default=8, help="Threads per worker in production mode")
+    parser.add_argument("--status-cache", action="store_true", help="Serve status from the watch-backed cache")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help="Comma separated endpoints to load, out of " + ", ".join(ENDPOINTS))
+    parser.add_argument("--rate", type=float, default=10, help="Requests per second to each endpoint")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to send requests for")
+    parser.add_argument("--applications", type=int, default=50, help="Number of distinct applications")
+    parser.add_argument("--config-bytes", type=int, default=2048, help="Size of the served configs")
+    parser.add_argument("--config-latency", type=float, default=0.02, help="Seconds Artifactory takes to respond")
+    parser.add_argument("--config-jitter", type=float, default=0.0, help="Standard deviation of that, in seconds")
+    parser.add_argument("--apiserver-latency", type=float, default=0.005,
+                        help="Seconds the apiserver takes to respond")
+    parser.add_argument("--apiserver-jitter", type=float, default=0.0, help="Standard deviation of that, in seconds")
+    parser.add_argument("--output", help="Write the results to this file as well")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of mast")
+    args = parser.parse_args()
+    unknown = set(args.endpoints.split(",")) - set(ENDPOINTS)
+    if unknown:
+        parser.error("Unknown endpoints: {}".format(", ".join(sorted(unknown))))
+
+    results = json.dumps(asyncio.run(run(args)), indent=2)
+    print(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(results + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local stand-ins for Artifactory and the apiserver, used by the load test
+
+The Artifactory stub serves generated fiaas configs after a configurable delay, with ETags so mast's config cache
+is exercised like against the real thing. The apiserver stub keeps applications, statuses and application-statuses
+of fiaas.schibsted.io/v1 in memory, supporting the requests mast and the k8s library make: discovery, list with
+label selectors, watch, get, create, update and JSON patch. Like fiaas-deploy-daemon, it reports every application
+it receives as deployed, by creating an application-status for its deployment_id.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import random
+
+import yaml
+from aiohttp import web
+
+GROUP_VERSION = "fiaas.schibsted.io/v1"
+PREFIX = "/apis/" + GROUP_VERSION
+KINDS = {"applications": "Application", "statuses": "Status", "application-statuses": "ApplicationStatus"}
+# Watches are closed after this many seconds, like the apiserver does, and the client reconnects
+WATCH_TIMEOUT = 60
+MAX_EVENTS = 10000
+
+
+def make_config(size, version=3):
+    """Make a fiaas config of about size bytes"""
+    config = {
+        "version": version,
+        "replicas": {"minimum": 2, "maximum": 10, "cpu_threshold_percentage": 75},
+        "resources": {"requests": {"cpu": "200m", "memory": "256Mi"}, "limits": {"cpu": "1", "memory": "512Mi"}},
+        "ports": [{"name": "http", "protocol": "http", "port": 80, "target_port": 8080}],
+        "healthchecks": {"liveness": {"http": {"path": "/_/health"}}},
+        "config": {"envs": {}},
+    }
+    data = yaml.safe_dump(config).encode("utf-8")
+    i = 0
+    while len(data) < size:
+        config["config"]["envs"]["ENV_VAR_{}".format(i)] = "value number {}".format(i)
+        i += 1
+        if i % 50 == 0 or len(data) + 40 * i >= size:
+            data = yaml.safe_dump(config).encode("utf-8")
+    return data
+
+
+def _delay(latency, jitter):
+    return max(0.0, random.gauss(latency, jitter)) if jitter else latency
+
+
+class Artifactory(object):
+    """Serves /configs/<name>.yml, the same generated config for every name"""
+
+    def __init__(self, latency=0.0, jitter=0.0, size=2048):
+        self.latency = latency
+        self.jitter = jitter
+        self.config = make_config(size)
+        self.etag = '"{}"'.format(hashlib.sha256(self.config).hexdigest())
+        self.app = web.Application()
+        self.app.router.add_get("/configs/{name}.yml", self.get_config)
+
+    async def get_config(self, request):
+        await asyncio.sleep(_delay(self.latency, self.jitter))
+        if request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304, headers={"ETag": self.etag})
+        return web.Response(body=self.config, content_type="application/x-yaml", headers={"ETag": self.etag})
+
+
+class Apiserver(object):
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.objects = {plural: {} for plural in KINDS}
+        self.events = []
+        self.resource_version = 0
+        self.watchers = set()
+        self.app = web.Application()
+        self.app.router.add_get(PREFIX, self.discovery)
+        self.app.router.add_get(PREFIX + "/{plural}", self.list_all)
+        self.app.router.add_get(PREFIX + "/watch/{plural}", self.watch)
+        self.app.router.add_get(PREFIX + "/namespaces/{namespace}/{plural}/", self.list_namespaced)
+        self.app.router.add_post(PREFIX + "/namespaces/{namespace}/{plural}/", self.create)
+        self.app.router.add_get(PREFIX + "/namespaces/{namespace}/{plural}/{name}", self.get)
+        self.app.router.add_put(PREFIX + "/namespaces/{namespace}/{plural}/{name}", self.update)
+        self.app.router.add_patch(PREFIX + "/namespaces/{namespace}/{plural}/{name}", self.patch)
+
+    def seed_status(self, namespace, application, deployment_id, result="SUCCESS"):
+        self._store("application-statuses", _status(namespace, application, deployment_id, result))
+
+    async def discovery(self, request):
+        return web.json_response({
+            "kind": "APIResourceList",
+            "groupVersion": GROUP_VERSION,
+            "resources": [{"name": plural, "namespaced": True, "kind": kind} for plural, kind in KINDS.items()],
+        })
+
+    async def list_all(self, request):
+        return await self._list(request, lambda obj: True)
+
+    async def list_namespaced(self, request):
+        namespace = request.match_info["namespace"]
+        return await self._list(request, lambda obj: obj["metadata"]["namespace"] == namespace)
+
+    async def _list(self, request, include):
+        await self._wait()
+        plural = self._plural(request)
+        selector = _parse_selector(request.query.get("labelSelector", ""))
+        items = [obj for obj in self.objects[plural].values() if include(obj) and _matches(obj, selector)]
+        return web.json_response({"kind": KINDS[plural] + "List", "apiVersion": GROUP_VERSION,
+                                  "metadata": {"resourceVersion": str(self.resource_version)}, "items": items})
+
+    async def get(self, request):
+        await self._wait()
+        return web.json_response(self._existing(request))
+
+    async def create(self, request):
+        await self._wait()
+        plural = self._plural(request)
+        obj = await request.json()
+        key = (request.match_info["namespace"], obj["metadata"]["name"])
+        if key in self.objects[plural]:
+            raise _error(409, "AlreadyExists")
+        return web.json_response(self._store(plural, obj), status=201)
+
+    async def update(self, request):
+        await self._wait()
+        self._existing(request)
+        return web.json_response(self._store(self._plural(request), await request.json()))
+
+    async def patch(self, request):
+        await self._wait()
+        obj = copy.deepcopy(self._existing(request))
+        for operation in await request.json():
+            _apply(obj, operation)
+        return web.json_response(self._store(self._plural(request), obj))
+
+    async def watch(self, request):
+        plural = self._plural(request)
+        since = int(request.query.get("resourceVersion") or self.resource_version)
+        resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        queue = asyncio.Queue()
+        for event in self.events:
+            if event[0] == plural and int(event[2]["metadata"]["resourceVersion"]) > since:
+                queue.put_nowait(event)
+        self.watchers.add(queue)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WATCH_TIMEOUT
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event_plural, event_type, obj = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if event_plural == plural:
+                    line = json.dumps({"type": event_type, "object": obj}) + "\n"
+                    await resp.write(line.encode("utf-8"))
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.watchers.discard(queue)
+        return resp
+
+    async def _wait(self):
+        await asyncio.sleep(_delay(self.latency, self.jitter))
+
+    @staticmethod
+    def _plural(request):
+        plural = request.match_info["plural"]
+        if plural not in KINDS:
+            raise web.HTTPNotFound()
+        return plural
+
+    def _existing(self, request):
+        key = (request.match_info["namespace"], request.match_info["name"])
+        obj = self.objects[self._plural(request)].get(key)
+        if obj is None:
+            raise _error(404, "NotFound")
+        return obj
+
+    def _store(self, plural, obj):
+        self.resource_version += 1
+        obj["metadata"]["resourceVersion"] = str(self.resource_version)
+        key = (obj["metadata"]["namespace"], obj["metadata"]["name"])
+        event_type = "MODIFIED" if key in self.objects[plural] else "ADDED"
+        self.objects[plural][key] = obj
+        self._publish(plural, event_type, obj)
+        if plural == "applications":
+            labels = obj["metadata"].get("labels") or {}
+            self._store("application-statuses", _status(obj["metadata"]["namespace"], labels.get("app"),
+                                                        labels.get("fiaas/deployment_id"), "SUCCESS"))
+        return obj
+
+    def _publish(self, plural, event_type, obj):
+        event = (plural, event_type, copy.deepcopy(obj))
+        self.events.append(event)
+        del self.events[:-MAX_EVENTS]
+        for queue in self.watchers:
+            queue.put_nowait(event)
+
+
+def _status(namespace, application, deployment_id, result):
+    return {
+        "apiVersion": GROUP_VERSION,
+        "kind": "ApplicationStatus",
+        "metadata": {
+            "name": "{}-{}".format(application, deployment_id),
+            "namespace": namespace,
+            "labels": {"app": application, "fiaas/deployment_id": deployment_id},
+        },
+        "result": result,
+        "logs": [],
+    }
+
+
+def _parse_selector(selector):
+    requirements = {}
+    for requirement in filter(None, selector.split(",")):
+        key, _, value = requirement.partition("=")
+        requirements[key] = value.lstrip("=")
+    return requirements
+
+
+def _matches(obj, selector):
+    labels = obj["metadata"].get("labels") or {}
+    return all(labels.get(key) == value for key, value in selector.items())
+
+
+def _apply(obj, operation):
+    """Apply one "add" or "replace" operation of a JSON patch"""
+    if operation["op"] not in ("add", "replace"):
+        raise _error(422, "Invalid")
+    *parents, last = [part.replace("~1", "/").replace("~0", "~") for part in operation["path"].split("/")[1:]]
+    target = obj
+    for part in parents:
+        target = target.setdefault(part, {})
+    target[last] = operation["value"]
+
+
+ERRORS = {404: web.HTTPNotFound, 409: web.HTTPConflict, 422: web.HTTPUnprocessableEntity}
+
+
+def _error(code, reason):
+    """An error with a body like the apiserver's Status objects"""
+    body = json.dumps({"kind": "Status", "status": "Failure", "reason": reason, "code": code})
+    return ERRORS[code](text=body, content_type="application/json")
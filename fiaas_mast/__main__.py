@@ -13,12 +13,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fiaas_mast.app import create_app
+from functools import partial
+
+from fiaas_mast.config import Config
 
 
 def main():
-    app = create_app()
-    app.run(host="0.0.0.0", port=int(app.config['PORT']), debug=bool(app.config['DEBUG']))
+    config = vars(Config())
+    if config['SERVER'] == "production":
+        from fiaas_mast.server import prepare_multiproc_dir, run
+        # Metrics are written to the shared directory as soon as they are created, which happens when the app
+        # modules are imported
+        prepare_multiproc_dir()
+        from fiaas_mast.app import create_app
+        run(partial(create_app, config), config)
+    elif config['SERVER'] == "asyncio":
+        from fiaas_mast.server import prepare_multiproc_dir
+        prepare_multiproc_dir()
+        from fiaas_mast.aio import run
+        run(config)
+    else:
+        from fiaas_mast.app import create_app
+        app = create_app(config)
+        app.run(host="0.0.0.0", port=int(app.config['PORT']), debug=bool(app.config['DEBUG']))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,508 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serve the JSON API of mast with asyncio
+
+Config downloads and apiserver calls are made with aiohttp, so a request waiting on Artifactory or the apiserver
+does not hold a thread, and one process can serve hundreds of concurrent deploy and status requests. The routes and
+responses are the same as in fiaas_mast.web. The HTML status page and its event stream are only served by the Flask
+app, which remains the default.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import ssl
+
+import aiohttp
+import requests
+from aiohttp import web as aioweb
+from k8s import config as k8s_config
+from k8s.client import NotFound, ClientError as ApiClientError, ServerError
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, multiprocess
+from werkzeug.exceptions import BadRequest, InternalServerError, UnprocessableEntity, default_exceptions
+
+from .apiserver import JSON_PATCH
+from .app import (configure_k8s, configure_logging, create_idempotency_store, create_manifest_cache, start_discovery,
+                  start_status_cache)
+from .application_generator import ApplicationGenerator
+from .common import ClientError, make_safe_name, parse_duration
+from .config_cache import ConfigCache, DEFAULT_MAX_BYTES, DEFAULT_TTL as CONFIG_CACHE_TTL, validators
+from .configmap_generator import ConfigMapGenerator
+from .deployer import (Deployer, DeployResult, WRITE_ATTEMPTS, create_histogram, deployment_id_of, is_conflict,
+                       is_unchanged, skipped_counter, update_histogram, write_requests)
+from .http_client import (RETRY_STATUSES, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_KEEPALIVE,
+                          DEFAULT_POOL_MAXSIZE, origin_of)
+from .idempotency import IDEMPOTENCY_KEY_HEADER, fingerprint
+from .models import ApplicationConfiguration
+from .status import STATUS_MODELS, pick, status, status_from
+from .status_cache import status_cache
+from .timing import phase
+from .web import (DEPLOY_FIELDS, DEFAULT_BATCH_DEPLOY_CONCURRENCY, DEFAULT_STATUS_MAX_WAIT, _batch_error,
+                  _missing_keys, _release, deploy_batch_histogram, deploy_histogram, generate_application_histogram,
+                  generate_configmap_histogram, health_histogram, metrics_histogram, status_histogram)
+
+LOGGER = logging.getLogger(__name__)
+
+CONFIG = aioweb.AppKey("config", dict)
+DOWNLOADER = aioweb.AppKey("downloader", object)
+API_CLIENT = aioweb.AppKey("api_client", object)
+IDEMPOTENCY = aioweb.AppKey("idempotency_store", object)
+MANIFESTS = aioweb.AppKey("manifest_cache", object)
+
+RETRIES = 10
+BACKOFF_FACTOR = 1
+BACKOFF_MAX = 120
+
+
+class Response(object):
+    """The parts of a requests.Response that the config parsers, the config cache and the deployer look at"""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError("{:d} Error for url: {}".format(self.status_code, self.url), response=self)
+
+
+async def request(session, method, url, retries=RETRIES, **kwargs):
+    """Make a request, retrying connection errors and the statuses retried by the blocking clients
+
+    Backs off exponentially between attempts, like urllib3's Retry.
+    """
+    for attempt in range(retries + 1):
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                content = await resp.read()
+                if resp.status not in RETRY_STATUSES or attempt == retries:
+                    return Response(str(resp.url), resp.status, resp.headers, content)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+        await asyncio.sleep(min(BACKOFF_FACTOR * (2 ** attempt), BACKOFF_MAX))
+
+
+class Downloader(object):
+    """Downloads configs from Artifactory, through the config cache if there is one"""
+
+    def __init__(self, session, auth, origin, cache=None):
+        self.session = session
+        self.auth = auth
+        self.origin = origin
+        self.cache = cache
+
+    async def config(self, url, parse):
+        try:
+            if self.cache is None:
+                resp = await self._get(url)
+                resp.raise_for_status()
+                return parse(resp)
+            entry = self.cache.lookup(url)
+            resp = await self._get(url, None if entry is None else validators(entry))
+            return self.cache.update(url, entry, resp, parse)
+        except (aiohttp.InvalidURL, ValueError) as e:
+            raise ClientError("Invalid config_url: {}".format(url)) from e
+
+    async def _get(self, url, headers=None):
+        auth = self.auth if origin_of(url) == self.origin else None
+        return await request(self.session, "GET", url, headers=headers, auth=auth)
+
+
+class AsyncApiClient(object):
+    """Makes apiserver requests without blocking, configured from k8s.config like the blocking client
+
+    Raises the same exceptions as k8s.client.Client.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def get(self, url, params=None):
+        return await self._call("GET", url, params=params)
+
+    async def post(self, url, body, params=None):
+        return await self._call("POST", url, body, params=params)
+
+    async def patch(self, url, body, content_type, params=None):
+        return await self._call("PATCH", url, body, params=params, headers={"Content-Type": content_type})
+
+    async def _call(self, method, url, body=None, params=None, headers=None):
+        headers = dict(headers or {})
+        token = k8s_config.api_token_source.token() if k8s_config.api_token_source else k8s_config.api_token
+        if token:
+            headers["Authorization"] = "Bearer {}".format(token)
+        resp = await request(self.session, method, k8s_config.api_server + url, json=body, params=params,
+                             headers=headers)
+        _raise_on_status(resp)
+        return resp
+
+
+def _raise_on_status(resp):
+    if resp.status_code < 400:
+        return
+    elif resp.status_code == 404:
+        exc = NotFound
+    elif resp.status_code < 500:
+        exc = ApiClientError
+    else:
+        exc = ServerError
+    raise exc("{:d} for url: {}".format(resp.status_code, resp.url), response=resp)
+
+
+def _ssl_context():
+    if not k8s_config.verify_ssl:
+        return False
+    cafile = k8s_config.verify_ssl if isinstance(k8s_config.verify_ssl, str) else None
+    context = ssl.create_default_context(cafile=cafile)
+    if k8s_config.cert:
+        cert = k8s_config.cert if isinstance(k8s_config.cert, tuple) else (k8s_config.cert,)
+        context.load_cert_chain(*cert)
+    return context
+
+
+async def deploy(app, target_namespace, release, idempotency_key=None, force=False):
+    """Same as Deployer.deploy
+
+    Concurrent repeats of a deploy are not collapsed here, only the ones that arrive after the first has finished.
+    """
+    # The deployer only builds the object here, the download and the write are done without blocking
+    deployer = Deployer(None)
+    with phase("deploy", "download"):
+        config = await app[DOWNLOADER].config(release.config_url, deployer.parse_config)
+    store = app[IDEMPOTENCY]
+    if store is None:
+        return await _deploy(app, deployer, target_namespace, release, config, force)
+    release_fingerprint = fingerprint(target_namespace, release, config)
+    key = idempotency_key or release_fingerprint
+    result = None if force else store.get(key, release_fingerprint)
+    if result is not None:
+        return result._replace(written=False)
+    result = await _deploy(app, deployer, target_namespace, release, config, force)
+    store.put(key, release_fingerprint, result)
+    return result
+
+
+async def _deploy(app, deployer, target_namespace, release, config, force):
+    api_client = app[API_CLIENT]
+    with phase("deploy", "build"):
+        namespace, deployment_id, application = deployer.build(target_namespace, release, config)
+    with phase("deploy", "read"):
+        try:
+            resp = await api_client.get(application._build_url(name=application.metadata.name, namespace=namespace))
+            current = deployer.application_model.from_dict(resp.json())
+        except NotFound:
+            current = None
+    if not force and is_unchanged(current, application):
+        skipped_counter.inc()
+        return DeployResult(namespace, release.application_name, deployment_id_of(current), False)
+    with phase("deploy", "write"):
+        await write(api_client, application, current is not None)
+    return DeployResult(namespace, release.application_name, deployment_id, True)
+
+
+async def write(api_client, application, exists):
+    """Same as Deployer._write"""
+    name, namespace = application.metadata.name, application.metadata.namespace
+    update, create = write_requests(application)
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        if exists:
+            try:
+                with update_histogram.time():
+                    await api_client.patch(update.url, update.body, JSON_PATCH, params=update.params)
+                return
+            except NotFound:
+                LOGGER.info("%s in %s was deleted, creating it", name, namespace)
+            except ApiClientError as e:
+                if not is_conflict(e) or attempt == WRITE_ATTEMPTS:
+                    raise
+                LOGGER.info("Conflict when updating %s in %s, retrying", name, namespace)
+                continue
+        try:
+            with create_histogram.time():
+                await api_client.post(create.url, create.body, params=create.params)
+            return
+        except ApiClientError as e:
+            if not is_conflict(e) or attempt == WRITE_ATTEMPTS:
+                raise
+            LOGGER.info("%s in %s was created by someone else, retrying update", name, namespace)
+            exists = True
+
+
+async def get_status(app, namespace, application, deployment_id):
+    """Same as status.status, using the apiserver without blocking until the status cache is ready"""
+    if status_cache.ready:
+        return status(namespace, application, deployment_id)
+    for model in STATUS_MODELS:
+        url = model._build_url(name="", namespace=namespace)
+        selector = model._label_selector({"fiaas/deployment_id": deployment_id})
+        try:
+            with phase("status", "lookup"):
+                resp = await app[API_CLIENT].get(url, params={"labelSelector": selector})
+            search_result = [model.from_dict(item) for item in resp.json()["items"]]
+            return status_from(application, deployment_id, pick(search_result, deployment_id))
+        except (NotFound, IndexError):
+            continue
+    return status_from(application, deployment_id, None)
+
+
+async def wait_for_change(app, namespace, application, deployment_id, since, timeout):
+    """Same as status.wait_for_change, waking up on changes to the status cache instead of blocking a thread"""
+    if not status_cache.ready:
+        return await get_status(app, namespace, application, deployment_id)
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(changed.set)
+
+    deadline = loop.time() + timeout
+    status_cache.subscribe(listener)
+    try:
+        while True:
+            changed.clear()
+            current = status(namespace, application, deployment_id)
+            remaining = deadline - loop.time()
+            if current.status != since or remaining <= 0:
+                return current
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        status_cache.unsubscribe(listener)
+
+
+async def health_check(request):
+    with health_histogram.time():
+        return aioweb.json_response("ok")
+
+
+async def deploy_handler(request):
+    with deploy_histogram.time():
+        data = await _json(request)
+        errors = _missing_keys(data, DEPLOY_FIELDS)
+        if errors:
+            raise UnprocessableEntity(errors)
+        namespace, application_name, deployment_id, written = await deploy(
+            request.app, data["namespace"], _release(data), request.headers.get(IDEMPOTENCY_KEY_HEADER),
+            bool(data.get("force")))
+        status_object = await get_status(request.app, namespace, application_name, deployment_id)
+        response = dict(status_object._asdict(), written=written)
+        return aioweb.json_response(response, status=201, headers={
+            "Location": _url(request, "/status/{}/{}/{}/", namespace, application_name, deployment_id)})
+
+
+async def deploy_batch_handler(request):
+    with deploy_batch_histogram.time():
+        data = await _json(request)
+        items = data.get("releases") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise UnprocessableEntity(["Missing list 'releases' in input"])
+        concurrency = asyncio.Semaphore(request.app[CONFIG].get('BATCH_DEPLOY_CONCURRENCY',
+                                                                DEFAULT_BATCH_DEPLOY_CONCURRENCY))
+
+        async def _deploy(item):
+            errors = _missing_keys(item, DEPLOY_FIELDS)
+            if errors:
+                return _batch_error(item, UnprocessableEntity(errors))
+            try:
+                async with concurrency:
+                    namespace, application_name, deployment_id, written = await deploy(
+                        request.app, item["namespace"], _release(item), force=bool(item.get("force")))
+            except Exception as e:
+                return _batch_error(item, e)
+            return {
+                "code": 201,
+                "namespace": namespace,
+                "application_name": application_name,
+                "deployment_id": deployment_id,
+                "written": written,
+                "status_url": _url(request, "/status/{}/{}/{}/", namespace, application_name, deployment_id),
+            }
+
+        results = await asyncio.gather(*(_deploy(item) for item in items))
+        return aioweb.json_response({"results": results})
+
+
+async def status_handler(request):
+    with status_histogram.time():
+        namespace = request.match_info["namespace"]
+        application = request.match_info["application"]
+        deployment_id = request.match_info["deployment_id"]
+        wait = request.query.get("wait")
+        since = request.query.get("since")
+        if wait and since:
+            timeout = min(parse_duration(wait), request.app[CONFIG].get('STATUS_MAX_WAIT', DEFAULT_STATUS_MAX_WAIT))
+            status_object = await wait_for_change(request.app, namespace, application, deployment_id, since, timeout)
+        else:
+            status_object = await get_status(request.app, namespace, application, deployment_id)
+        status_url = _url(request, "/status/view/{}/{}/{}/", namespace, application, deployment_id)
+        return aioweb.json_response({"status": status_object.status,
+                                     "info": "For additional deployment information go to: {}".format(status_url),
+                                     "deployment_status_url": status_url})
+
+
+async def generate_application(request):
+    with generate_application_histogram.time():
+        data = await _json(request)
+        errors = _missing_keys(data, ("application_name", "config_url", "image"))
+        if errors:
+            raise UnprocessableEntity(errors)
+        release = _release(data)
+        generator = ApplicationGenerator(None, manifest_cache=request.app[MANIFESTS])
+        with phase(generator.operation, "download"):
+            config = await request.app[DOWNLOADER].config(release.config_url, generator.parse_config)
+        with phase(generator.operation, "build"):
+            deployment_id, manifest = generator.render_config(data["namespace"], release, config)
+        return aioweb.json_response({
+            "manifest": manifest,
+            "deployment_id": deployment_id,
+            "status_url": _url(request, "/status/{}/{}/{}/", data["namespace"],
+                               make_safe_name(data["application_name"]), deployment_id)
+        })
+
+
+async def generate_configmap(request):
+    with generate_configmap_histogram.time():
+        data = await _json(request)
+        errors = _missing_keys(data, ("application_name", "application_data_url"))
+        if errors:
+            raise UnprocessableEntity(errors)
+        configmap_request = ApplicationConfiguration(
+            data["application_data_url"],
+            make_safe_name(data["application_name"]),
+            data["application_name"],
+            data.get("spinnaker_tags", {}),
+            data.get("raw_tags", {}),
+            data.get("metadata_annotations", {}))
+        generator = ConfigMapGenerator(None)
+        with phase(generator.operation, "download"):
+            config = await request.app[DOWNLOADER].config(configmap_request.application_data_url,
+                                                          generator.parse_config)
+        with phase(generator.operation, "build"):
+            deployment_id, config_map = generator.build(data["namespace"], configmap_request, config)
+        return aioweb.json_response({"manifest": config_map, "deployment_id": deployment_id})
+
+
+async def metrics(request):
+    with metrics_histogram.time():
+        registry = REGISTRY
+        if "prometheus_multiproc_dir" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        resp = aioweb.Response(body=generate_latest(registry))
+        resp.headers["Content-Type"] = CONTENT_TYPE_LATEST
+        return resp
+
+
+async def _json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise BadRequest("Failed to decode JSON object")
+
+
+def _url(request, path, *args):
+    scheme = request.app[CONFIG].get('scheme', 'https')
+    return "{}://{}{}".format(scheme, request.host, path.format(*args))
+
+
+@aioweb.middleware
+async def error_middleware(request, handler):
+    """Render errors as JSON, like fiaas_mast.app.error_handler"""
+    try:
+        return await handler(request)
+    except aioweb.HTTPException as e:
+        if e.status < 400:
+            raise
+        error = default_exceptions.get(e.status, InternalServerError)()
+    except Exception as e:
+        error = e
+    if not all(hasattr(error, attr) for attr in ("code", "name", "description")):
+        LOGGER.error("An error occured: %r", error, exc_info=error)
+        error = InternalServerError()
+    resp = {
+        "code": error.code,
+        "name": error.name,
+        "description": error.description
+    }
+    return aioweb.json_response(resp, status=resp["code"])
+
+
+@aioweb.middleware
+async def security_headers(request, handler):
+    """The headers Talisman adds to the responses of the Flask app that matter for a JSON API"""
+    resp = await handler(request)
+    resp.headers["X-Frame-Options"] = "DENY"
+    resp.headers["X-Content-Type-Options"] = "nosniff"
+    resp.headers["Strict-Transport-Security"] = "max-age=31556926; includeSubDomains"
+    return resp
+
+
+async def _clients(app):
+    config = app[CONFIG]
+    timeout = aiohttp.ClientTimeout(sock_connect=config.get('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                                    sock_read=config.get('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+    artifactory = aiohttp.ClientSession(
+        timeout=timeout,
+        connector=aiohttp.TCPConnector(limit_per_host=config.get('HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE),
+                                       keepalive_timeout=config.get('HTTP_KEEPALIVE', DEFAULT_KEEPALIVE)))
+    apiserver = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=k8s_config.timeout),
+                                      connector=aiohttp.TCPConnector(ssl=_ssl_context()))
+    cache = None
+    max_bytes = config.get('CONFIG_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    if max_bytes:
+        cache = ConfigCache(max_bytes, config.get('CONFIG_CACHE_TTL', CONFIG_CACHE_TTL))
+    auth = aiohttp.BasicAuth(config['ARTIFACTORY_USER'], config['ARTIFACTORY_PWD'])
+    app[DOWNLOADER] = Downloader(artifactory, auth, config['ARTIFACTORY_ORIGIN'], cache)
+    app[API_CLIENT] = AsyncApiClient(apiserver)
+    yield
+    await artifactory.close()
+    await apiserver.close()
+
+
+def create_app(config):
+    """Create the aiohttp app"""
+    configure_k8s(config)
+    start_discovery(config)
+    start_status_cache(config)
+    configure_logging()
+
+    app = aioweb.Application(middlewares=[error_middleware, security_headers])
+    app[CONFIG] = config
+    app[IDEMPOTENCY] = create_idempotency_store(config)
+    app[MANIFESTS] = create_manifest_cache(config)
+    app.cleanup_ctx.append(_clients)
+    app.router.add_get("/health", health_check)
+    for method in ("PUT", "POST"):
+        app.router.add_route(method, "/deploy/", deploy_handler)
+        app.router.add_route(method, "/deploy/batch", deploy_batch_handler)
+    app.router.add_get("/status/{namespace}/{application}/{deployment_id}/", status_handler)
+    app.router.add_post("/generate/application", generate_application)
+    app.router.add_post("/generate/configmap", generate_configmap)
+    app.router.add_get("/_/metrics", metrics)
+    return app
+
+
+def run(config):
+    aioweb.run_app(create_app(config), port=int(config['PORT']), backlog=config['SERVER_BACKLOG'])
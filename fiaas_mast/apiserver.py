@@ -0,0 +1,32 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from k8s import config
+from k8s.client import Client
+
+# Used as fieldManager on writes, so the apiserver can tell which fields mast owns
+FIELD_MANAGER = "fiaas-mast"
+
+JSON_PATCH = "application/json-patch+json"
+
+
+class ApiClient(Client):
+    """The k8s Client, extended with PATCH and with query parameters on POST"""
+
+    def post(self, url, body, timeout=config.timeout, params=None):
+        return self._call("POST", url, body, timeout=timeout, params=params)
+
+    def patch(self, url, body, content_type, timeout=config.timeout, params=None):
+        return self._call("PATCH", url, body, timeout=timeout, params=params, headers={"Content-Type": content_type})
@@ -23,6 +23,13 @@ from k8s import config as k8s_config
 from werkzeug.exceptions import InternalServerError, HTTPException
 
 from fiaas_mast.config import Config
+from fiaas_mast.config_cache import CONFIG_CACHE, ConfigCache, DEFAULT_MAX_BYTES, DEFAULT_TTL as CONFIG_CACHE_TTL
+from fiaas_mast.discovery import registry, DEFAULT_TTL
+from fiaas_mast.http_client import HTTP_CLIENT, create_http_client
+from fiaas_mast.idempotency import (IDEMPOTENCY_STORE, IdempotencyStore, DEFAULT_WINDOW as IDEMPOTENCY_WINDOW,
+                                    DEFAULT_MAX_KEYS as IDEMPOTENCY_MAX_KEYS)
+from fiaas_mast.manifest_cache import MANIFEST_CACHE, ManifestCache, DEFAULT_MAX_BYTES as MANIFEST_CACHE_MAX_BYTES
+from fiaas_mast.status_cache import status_cache
 from fiaas_mast.web import web
 
 LOGGER = logging.getLogger(__name__)
@@ -36,6 +43,12 @@ def create_app(config=None):
     configure_blueprints(app)
     configure_error_handler(app)
     configure_k8s_client(app)
+    configure_discovery(app)
+    configure_http_client(app)
+    configure_config_cache(app)
+    configure_manifest_cache(app)
+    configure_idempotency_store(app)
+    configure_status_cache(app)
     configure_bootstrap(app)
     configure_logging()
 
@@ -79,18 +92,80 @@ def configure_logging():
 
 
 def configure_k8s_client(app):
+    configure_k8s(app.config)
+
+
+def configure_k8s(config):
     k8s_config.debug = True
 
-    if app.config.get('APISERVER_TOKEN'):
-        k8s_config.api_token = app.config.get('APISERVER_TOKEN')
+    if config.get('APISERVER_URL'):
+        k8s_config.api_server = config.get('APISERVER_URL')
+
+    if config.get('APISERVER_TOKEN'):
+        k8s_config.api_token = config.get('APISERVER_TOKEN')
     else:
         # use default in-cluster config if api_token is not explicitly set
         # sets api_token_source and verify_ssl
         k8s_config.use_in_cluster_config()
 
     # if api_cert is explicitly set, override in-cluster config setting (if used)
-    if app.config.get('APISERVER_CA_CERT'):
-        k8s_config.verify_ssl = app.config.get('APISERVER_CA_CERT')
+    if config.get('APISERVER_CA_CERT'):
+        k8s_config.verify_ssl = config.get('APISERVER_CA_CERT')
+
+
+def configure_discovery(app):
+    start_discovery(app.config)
+
+
+def start_discovery(config):
+    registry.ttl = config.get('DISCOVERY_TTL', DEFAULT_TTL)
+    if config.get('DISCOVERY_REFRESH'):
+        registry.start()
+
+
+def configure_http_client(app):
+    app.extensions[HTTP_CLIENT] = create_http_client(app.config)
+
+
+def configure_config_cache(app):
+    max_bytes = app.config.get('CONFIG_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    if max_bytes:
+        app.extensions[CONFIG_CACHE] = ConfigCache(max_bytes, app.config.get('CONFIG_CACHE_TTL', CONFIG_CACHE_TTL))
+
+
+def configure_manifest_cache(app):
+    cache = create_manifest_cache(app.config)
+    if cache is not None:
+        app.extensions[MANIFEST_CACHE] = cache
+
+
+def create_manifest_cache(config):
+    max_bytes = config.get('MANIFEST_CACHE_MAX_BYTES', MANIFEST_CACHE_MAX_BYTES)
+    if max_bytes:
+        return ManifestCache(max_bytes)
+    return None
+
+
+def configure_idempotency_store(app):
+    store = create_idempotency_store(app.config)
+    if store is not None:
+        app.extensions[IDEMPOTENCY_STORE] = store
+
+
+def create_idempotency_store(config):
+    window = config.get('DEPLOY_IDEMPOTENCY_WINDOW', IDEMPOTENCY_WINDOW)
+    if window:
+        return IdempotencyStore(window, config.get('DEPLOY_IDEMPOTENCY_MAX_KEYS', IDEMPOTENCY_MAX_KEYS))
+    return None
+
+
+def configure_status_cache(app):
+    start_status_cache(app.config)
+
+
+def start_status_cache(config):
+    if config.get('STATUS_CACHE'):
+        status_cache.start()
 
 
 def error_handler(error):
@@ -14,17 +14,56 @@
 # limitations under the License.
 
 from .common import check_models, generate_random_uuid_string, ClientError
+from .idempotency import fingerprint
 from .metadata_generator import MetadataGenerator
+from .timing import phase
 
 
 class ApplicationGenerator(MetadataGenerator):
-    def __init__(self, http_client, create_deployment_id=generate_random_uuid_string):
-        super().__init__(http_client, create_deployment_id)
-        self.application_model, self.spec_model = check_models()
+    operation = "generate_application"
+
+    def __init__(self, http_client, create_deployment_id=generate_random_uuid_string, config_cache=None,
+                 manifest_cache=None):
+        super().__init__(http_client, create_deployment_id, config_cache)
+        self.manifest_cache = manifest_cache
+        with phase(self.operation, "discovery"):
+            self.application_model, self.spec_model = check_models()
 
     def generate_application(self, target_namespace, release):
         """Generate Application manifest for application"""
-        spec = self.spec(release)
+        config = self.download_config(release.config_url)
+        with phase(self.operation, "build"):
+            return self.build(target_namespace, release, config)
+
+    def render(self, target_namespace, release):
+        """Generate Application manifest for application as a dict, from the manifest cache when possible"""
+        config = self.download_config(release.config_url)
+        with phase(self.operation, "build"):
+            return self.render_config(target_namespace, release, config)
+
+    def render_config(self, target_namespace, release, config):
+        """Generate Application manifest for application from its config as a dict
+
+        Manifests are cached without regard to the deployment_id, which is filled in on every call. The returned
+        manifest may be shared with other callers and must not be modified.
+        """
+        if self.manifest_cache is None:
+            deployment_id, application = self.build(target_namespace, release, config)
+            return deployment_id, application.as_dict()
+        key = fingerprint(target_namespace, release, config)
+        manifest = self.manifest_cache.get(key)
+        if manifest is None:
+            deployment_id, application = self.build(target_namespace, release, config)
+            manifest = application.as_dict()
+            self.manifest_cache.put(key, manifest)
+            return deployment_id, manifest
+        deployment_id = self.create_deployment_id()
+        labels = dict(manifest["metadata"]["labels"], **{"fiaas/deployment_id": deployment_id})
+        return deployment_id, dict(manifest, metadata=dict(manifest["metadata"], labels=labels))
+
+    def build(self, target_namespace, release, config):
+        """Generate Application manifest for application from its config"""
+        spec = self.spec(release, config)
         deployment_id = self.create_deployment_id()
         config = spec.config
         namespace = config["namespace"] if (config['version'] < 3) and ("namespace" in config) else target_namespace
@@ -32,8 +71,7 @@ class ApplicationGenerator(MetadataGenerator):
         application = self.application_model(metadata=metadata, spec=spec)
         return deployment_id, application
 
-    def spec(self, release):
-        config = self.download_config(release.config_url)
+    def spec(self, release, config):
         if not config:
             raise ClientError("Invalid config: {}".format(release.config_url))
 
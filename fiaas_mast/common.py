@@ -17,12 +17,15 @@ import collections.abc
 import logging
 import uuid
 
-from k8s.client import NotFound
+import yaml
 
-from fiaas_mast.fiaas import FiaasApplication, FiaasApplicationSpec
+from fiaas_mast.discovery import registry
 
 LOG = logging.getLogger(__name__)
 
+# libyaml is much faster, but is an optional part of pyyaml
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def dict_merge(dct, merge_dct):
     """ Recursive dict merge. Inspired by :meth:``dict.update()``, instead of
@@ -41,6 +44,11 @@ def dict_merge(dct, merge_dct):
             dct[k] = merge_dct[k]
 
 
+def load_yaml(data):
+    """Parse YAML from bytes or str, using libyaml when it is available"""
+    return yaml.load(data, Loader=SafeLoader)
+
+
 def generate_random_uuid_string():
     id = uuid.uuid4()
     return str(id)
@@ -51,16 +59,23 @@ def make_safe_name(name):
     return safe_name
 
 
+def parse_duration(value):
+    """Parse a duration such as "30", "30s" or "2m" into seconds"""
+    try:
+        if value.endswith("m"):
+            return float(value[:-1]) * 60
+        if value.endswith("s"):
+            return float(value[:-1])
+        return float(value)
+    except ValueError:
+        raise ClientError("Invalid duration: {}".format(value))
+
+
 def check_models():
-    for app_model, spec_model in [
-            (FiaasApplication, FiaasApplicationSpec)
-    ]:
-        try:
-            app_model.list()
-            return app_model, spec_model
-        except NotFound:
-            LOG.debug("{} was not found".format(app_model))
-    raise PlatformError("Unable to find support for FiaasApplication in the cluster")
+    models = registry.lookup()
+    if models is None:
+        raise PlatformError("Unable to find support for FiaasApplication in the cluster")
+    return models
 
 
 class ClientError(Exception):
@@ -22,6 +22,8 @@ class Config(object):
         self.DEBUG = os.environ.get('DEBUG', False)
         self.APISERVER_TOKEN = self.get_apiserver_token()
         self.APISERVER_CA_CERT = self.get_apiserver_cert()
+        # Only needed when running outside the cluster
+        self.APISERVER_URL = os.environ.get('APISERVER_URL')
 
         self.ARTIFACTORY_USER = os.environ.get('ARTIFACTORY_USER')
         self.ARTIFACTORY_PWD = os.environ.get('ARTIFACTORY_PWD')
@@ -33,6 +35,43 @@ class Config(object):
             )
         self.scheme = os.environ.get('URL_SCHEME', 'https')
 
+        # "development" runs the Werkzeug server, "production" runs gunicorn, "asyncio" runs the aiohttp server
+        self.SERVER = os.environ.get('SERVER', 'development')
+        self.SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 2))
+        self.SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+        self.SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', 2048))
+        self.SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))
+        self.SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 120))
+        self.SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+
+        self.DISCOVERY_TTL = int(os.environ.get('DISCOVERY_TTL', 300))
+        self.DISCOVERY_REFRESH = os.environ.get('DISCOVERY_REFRESH', 'true').lower() == 'true'
+
+        self.HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))
+        self.HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+        self.HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+        self.HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 30))
+        self.HTTP_KEEPALIVE = int(os.environ.get('HTTP_KEEPALIVE', 60))
+
+        # How many releases of a /deploy/batch request are deployed at the same time
+        self.BATCH_DEPLOY_CONCURRENCY = int(os.environ.get('BATCH_DEPLOY_CONCURRENCY', 8))
+
+        # Repeating a deploy within this many seconds returns the first result without writing anything, 0 disables
+        self.DEPLOY_IDEMPOTENCY_WINDOW = int(os.environ.get('DEPLOY_IDEMPOTENCY_WINDOW', 600))
+        self.DEPLOY_IDEMPOTENCY_MAX_KEYS = int(os.environ.get('DEPLOY_IDEMPOTENCY_MAX_KEYS', 10000))
+
+        self.CONFIG_CACHE_MAX_BYTES = int(os.environ.get('CONFIG_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        self.CONFIG_CACHE_TTL = int(os.environ.get('CONFIG_CACHE_TTL', 3600))
+        # Rendered /generate/application manifests are kept up to this size in total, 0 disables
+        self.MANIFEST_CACHE_MAX_BYTES = int(os.environ.get('MANIFEST_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+        # Requires permission to list and watch statuses and application-statuses in all namespaces
+        self.STATUS_CACHE = os.environ.get('STATUS_CACHE', 'false').lower() == 'true'
+        # Upper limit for ?wait= on the status endpoint, in seconds
+        self.STATUS_MAX_WAIT = float(os.environ.get('STATUS_MAX_WAIT', 60))
+        # How long a status event stream stays open before the browser has to reconnect, in seconds
+        self.STATUS_STREAM_TIMEOUT = float(os.environ.get('STATUS_STREAM_TIMEOUT', 300))
+
     def get_apiserver_token(self):
         return os.environ.get('APISERVER_TOKEN')
 
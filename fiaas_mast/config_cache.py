@@ -0,0 +1,139 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import requests
+from prometheus_client import Counter
+
+# Key of the shared cache in app.extensions
+CONFIG_CACHE = "mast_config_cache"
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL = 3600
+
+cache_counter = Counter("config_cache_requests", "Config downloads, by how the cache could serve them", ["result"])
+
+_Entry = namedtuple("_Entry", ["digest", "etag", "last_modified", "value", "size", "expires_at"])
+
+
+def fetch_config(http_client, url, parse, cache=None):
+    """Download and parse the config at url, through the cache if there is one"""
+    if cache is not None:
+        return cache.get(http_client, url, parse)
+    resp = http_client.get(url)
+    resp.raise_for_status()
+    return parse(resp)
+
+
+class ConfigCache(object):
+    """LRU cache of downloaded and parsed configs
+
+    Every lookup is revalidated with the server using the ETag and Last-Modified validators of the cached response,
+    so a changed artifact is never served stale. When the server answers with the full body anyway, the content
+    digest decides whether the cached parse can be reused. The cache is bounded by the total size of the downloaded
+    bodies and by the age of each entry. Callers always get a deep copy, so they are free to modify it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, http_client, url, parse):
+        entry = self.lookup(url)
+        if entry is None:
+            resp = http_client.get(url)
+        else:
+            resp = http_client.get(url, headers=validators(entry))
+        return self.update(url, entry, resp, parse)
+
+    def update(self, url, entry, resp, parse):
+        """Store the response to a request for url, made with the validators of entry, and return the parsed value
+
+        Only needs status_code, headers, content and raise_for_status() from resp, so responses from other HTTP
+        clients can be adapted to it.
+        """
+        if entry is not None and resp.status_code == requests.codes.not_modified:
+            cache_counter.labels("not_modified").inc()
+            self._store(url, entry._replace(expires_at=self._clock() + self.ttl))
+            return copy.deepcopy(entry.value)
+        resp.raise_for_status()
+        content = resp.content
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry.digest == digest:
+            cache_counter.labels("unchanged").inc()
+            value = entry.value
+        else:
+            cache_counter.labels("miss").inc()
+            value = parse(resp)
+        self._store(url, _Entry(digest=digest,
+                                etag=resp.headers.get("ETag"),
+                                last_modified=resp.headers.get("Last-Modified"),
+                                value=value,
+                                size=len(content),
+                                expires_at=self._clock() + self.ttl))
+        return copy.deepcopy(value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def lookup(self, url):
+        """Return the entry for url if it has not expired, or None"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if entry.expires_at <= self._clock():
+                self._remove(url)
+                return None
+            self._entries.move_to_end(url)
+            return entry
+
+    def _store(self, url, entry):
+        with self._lock:
+            self._remove(url)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[url] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+def validators(entry):
+    """Headers that ask the server to only send the body if it differs from the one in entry"""
+    headers = {}
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
@@ -15,13 +15,19 @@
 
 
 from .metadata_generator import MetadataGenerator
+from .timing import phase
 
 
 class ConfigMapGenerator(MetadataGenerator):
+    operation = "generate_configmap"
 
     def generate_configmap(self, target_namespace, configmap_request):
-        deployment_id = self.create_deployment_id()
         data = self.download_config(configmap_request.application_data_url)
+        with phase(self.operation, "build"):
+            return self.build(target_namespace, configmap_request, data)
+
+    def build(self, target_namespace, configmap_request, data):
+        deployment_id = self.create_deployment_id()
         metadata = self.metadata(configmap_request, target_namespace, deployment_id)
         configmap_manifest = {
             "apiVersion": "v1",
@@ -13,47 +13,203 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import yaml
-from k8s.client import NotFound
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from k8s.client import NotFound, ClientError as ApiClientError
 from k8s.models.common import ObjectMeta
+from prometheus_client import Counter, Histogram
+from requests import codes
 from requests.exceptions import MissingSchema, InvalidURL
 
-from .common import generate_random_uuid_string, ClientError, check_models
+from .apiserver import ApiClient, FIELD_MANAGER, JSON_PATCH
+from .common import generate_random_uuid_string, ClientError, check_models, load_yaml
+from .config_cache import fetch_config
+from .idempotency import fingerprint
+from .timing import phase
+
+LOG = logging.getLogger(__name__)
+
+WRITE_ATTEMPTS = 3
+
+DEPLOYMENT_ID_LABEL = "fiaas/deployment_id"
+
+WriteRequest = namedtuple("WriteRequest", ["url", "body", "params"])
+# written is False when the application already had the same spec and labels, or the deploy repeated an earlier one
+DeployResult = namedtuple("DeployResult", ["namespace", "application_name", "deployment_id", "written"])
+
+write_histogram = Histogram("deploy_write_latency", "Latency of writing Application objects in seconds",
+                            ["operation"])
+update_histogram = write_histogram.labels("update")
+create_histogram = write_histogram.labels("create")
+skipped_counter = Counter("deploy_skipped_writes", "Deploys that were not written because nothing had changed")
 
 
 class Deployer:
-    def __init__(self, http_client, create_deployment_id=generate_random_uuid_string):
+    def __init__(self, http_client, create_deployment_id=generate_random_uuid_string, config_cache=None,
+                 api_client=None, idempotency_store=None):
         self.http_client = http_client
         self.create_deployment_id = create_deployment_id
-        self.application_model, self.spec_model = check_models()
+        self.config_cache = config_cache
+        self.idempotency_store = idempotency_store
+        self.api_client = api_client if api_client is not None else ApiClient()
+        with phase("deploy", "discovery"):
+            self.application_model, self.spec_model = check_models()
 
-    def deploy(self, target_namespace, release):
-        """Create or update TPR for application"""
-        application_name = release.application_name
+    def deploy(self, target_namespace, release, idempotency_key=None, force=False):
+        """Create or update TPR for application
+
+        Nothing is written when the application already has the same spec and labels. Its deployment_id is returned
+        instead, unless force is set.
+
+        With an idempotency store, repeating a deploy within its window returns the result of the first one without
+        writing anything. Deploys are matched by idempotency_key, or by their content when no key is given. Forced
+        deploys are always written.
+        """
         config = self.download_config(release.config_url)
+        if self.idempotency_store is None:
+            return self._deploy(target_namespace, release, config, force)
+        release_fingerprint = fingerprint(target_namespace, release, config)
+        key = idempotency_key or release_fingerprint
+        if force:
+            result = self._deploy(target_namespace, release, config, force)
+            self.idempotency_store.put(key, release_fingerprint, result)
+            return result
+        deployed = []
+
+        def _deploy():
+            deployed.append(True)
+            return self._deploy(target_namespace, release, config, force)
+
+        result = self.idempotency_store.run(key, release_fingerprint, _deploy)
+        return result if deployed else result._replace(written=False)
+
+    def _deploy(self, target_namespace, release, config, force):
+        with phase("deploy", "build"):
+            namespace, deployment_id, application = self.build(target_namespace, release, config)
+        with phase("deploy", "read"):
+            current = self._current(application)
+        if not force and is_unchanged(current, application):
+            skipped_counter.inc()
+            return DeployResult(namespace, release.application_name, deployment_id_of(current), False)
+        with phase("deploy", "write"):
+            self._write(application, current is not None)
+
+        return DeployResult(namespace, release.application_name, deployment_id, True)
+
+    def _current(self, application):
+        try:
+            resp = self.api_client.get(application._build_url(name=application.metadata.name,
+                                                              namespace=application.metadata.namespace))
+        except NotFound:
+            return None
+        return self.application_model.from_dict(resp.json())
+
+    def build(self, target_namespace, release, config):
+        """Build the application object for a release from its config
+
+        Returns the namespace it goes to, its deployment_id and the object.
+        """
+        application_name = release.application_name
         namespace = config["namespace"] if (config['version'] < 3) and ("namespace" in config) else target_namespace
         deployment_id = self.create_deployment_id()
-        labels = {"fiaas/deployment_id": deployment_id, "app": application_name}
+        labels = {DEPLOYMENT_ID_LABEL: deployment_id, "app": application_name}
         metadata = ObjectMeta(name=application_name, namespace=namespace, labels=labels)
         spec = self.spec_model(application=application_name, image=release.image, config=config)
-        try:
-            application = self.application_model.get(application_name, namespace)
-            application.metadata = metadata
-            application.spec = spec
-        except NotFound:
-            application = self.application_model(metadata=metadata, spec=spec)
-        application.save()
+        return namespace, deployment_id, self.application_model(metadata=metadata, spec=spec)
+
+    def _write(self, application, exists):
+        """Replace labels and spec of the application with a single patch, or create it if it does not exist
+
+        If the application is created or deleted by someone else while we write, the write is tried again.
+        """
+        name, namespace = application.metadata.name, application.metadata.namespace
+        update, create = write_requests(application)
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            if exists:
+                try:
+                    with update_histogram.time():
+                        self.api_client.patch(update.url, update.body, JSON_PATCH, params=update.params)
+                    return
+                except NotFound:
+                    LOG.info("%s in %s was deleted, creating it", name, namespace)
+                except ApiClientError as e:
+                    if not is_conflict(e) or attempt == WRITE_ATTEMPTS:
+                        raise
+                    LOG.info("Conflict when updating %s in %s, retrying", name, namespace)
+                    continue
+            try:
+                with create_histogram.time():
+                    self.api_client.post(create.url, create.body, params=create.params)
+                return
+            except ApiClientError as e:
+                if not is_conflict(e) or attempt == WRITE_ATTEMPTS:
+                    raise
+                LOG.info("%s in %s was created by someone else, retrying update", name, namespace)
+                exists = True
 
-        return namespace, application_name, deployment_id
+    def deploy_all(self, deployments, max_workers):
+        """Deploy a list of (target_namespace, release) concurrently, using at most max_workers threads
+
+        Returns a list in the same order, holding the result of deploy() or the exception it raised for each item.
+        """
+        def _deploy(deployment):
+            try:
+                return self.deploy(*deployment)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_deploy, deployments))
 
     def download_config(self, config_url):
         try:
-            resp = self.http_client.get(config_url)
+            with phase("deploy", "download"):
+                return fetch_config(self.http_client, config_url, self.parse_config, self.config_cache)
         except (InvalidURL, MissingSchema) as e:
             raise ClientError("Invalid config_url") from e
-        resp.raise_for_status()
-        app_config = yaml.safe_load(resp.text)
-        return app_config
+
+    @staticmethod
+    def parse_config(resp):
+        with phase("deploy", "parse"):
+            return load_yaml(resp.content)
+
+
+def write_requests(application):
+    """The requests that update and create the application"""
+    name, namespace = application.metadata.name, application.metadata.namespace
+    params = {"fieldManager": FIELD_MANAGER}
+    patch = [
+        {"op": "add", "path": "/metadata/labels", "value": application.metadata.labels},
+        {"op": "add", "path": "/spec", "value": application.spec.as_dict()},
+    ]
+    return (WriteRequest(application._build_url(name=name, namespace=namespace), patch, params),
+            WriteRequest(application._build_url(name="", namespace=namespace), application.as_dict(), params))
+
+
+def is_unchanged(current, application):
+    """Whether writing application would leave current, the live object or None, the same
+
+    The deployment_id label is left out, since every deploy makes a new one.
+    """
+    if current is None or current.spec is None:
+        return False
+    labels = current.metadata.labels or {}
+    if DEPLOYMENT_ID_LABEL not in labels:
+        return False
+    for key, value in application.metadata.labels.items():
+        if key != DEPLOYMENT_ID_LABEL and labels.get(key) != value:
+            return False
+    return current.spec.as_dict() == application.spec.as_dict()
+
+
+def deployment_id_of(application):
+    return (application.metadata.labels or {}).get(DEPLOYMENT_ID_LABEL)
+
+
+def is_conflict(e):
+    return e.response is not None and e.response.status_code == codes.conflict
 
 
 class DeployerError(Exception):
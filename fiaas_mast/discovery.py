@@ -0,0 +1,115 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+
+from k8s.client import NotFound
+from prometheus_client import Counter
+
+from .fiaas import FiaasApplication, FiaasApplicationSpec
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+
+discovery_counter = Counter("crd_discovery_requests", "Number of API discovery requests sent to the apiserver")
+
+# Each candidate is the API group version to ask, the resource it must serve, and the models to use if it does
+CANDIDATES = (
+    ("/apis/fiaas.schibsted.io/v1", "applications", FiaasApplication, FiaasApplicationSpec),
+)
+
+
+class ModelRegistry(object):
+    """Remembers which fiaas models the cluster supports
+
+    Discovery asks the apiserver for the resources of an API group version, which is cheap compared to listing
+    every Application in the cluster. The result, including the absence of support, is kept for `ttl` seconds.
+    When started, a background thread refreshes the result before it expires, so requests never wait for discovery.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._models = None
+        self._expires_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def lookup(self):
+        """Return a tuple of (application_model, spec_model), or None if the cluster has no support for fiaas"""
+        with self._lock:
+            if self._is_fresh():
+                return self._models
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited for the lock
+            with self._lock:
+                if self._is_fresh():
+                    return self._models
+            return self.refresh()
+
+    def refresh(self):
+        models = self._discover()
+        with self._lock:
+            self._models = models
+            self._expires_at = self._clock() + self.ttl
+        return models
+
+    def start(self):
+        """Resolve models in a background thread, and keep refreshing them at half the ttl"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                LOG.exception("Failed to refresh supported models, keeping the previous result")
+            if self._stop.wait(self.ttl / 2):
+                return
+
+    def _is_fresh(self):
+        return self._expires_at is not None and self._clock() < self._expires_at
+
+    @staticmethod
+    def _discover():
+        for url, resource, app_model, spec_model in CANDIDATES:
+            discovery_counter.inc()
+            try:
+                resp = app_model._client.get(url)
+            except NotFound:
+                LOG.debug("{} was not found".format(url))
+                continue
+            if any(r.get("name") == resource for r in resp.json().get("resources", [])):
+                return app_model, spec_model
+            LOG.debug("{} does not serve {}".format(url, resource))
+        return None
+
+
+registry = ModelRegistry()
@@ -57,6 +57,8 @@ class FiaasStatus(Model):
     """Deprecated. This model will be removed as soon as migration to ApplicationStatus is complete"""
     class Meta:
         url_template = "/apis/fiaas.schibsted.io/v1/namespaces/{namespace}/statuses/{name}"
+        list_url = "/apis/fiaas.schibsted.io/v1/statuses"
+        watch_list_url = "/apis/fiaas.schibsted.io/v1/watch/statuses"
 
     # Workaround for https://github.com/kubernetes/kubernetes/issues/44182
     apiVersion = Field(str, "fiaas.schibsted.io/v1")
@@ -70,6 +72,8 @@ class FiaasStatus(Model):
 class FiaasApplicationStatus(Model):
     class Meta:
         url_template = "/apis/fiaas.schibsted.io/v1/namespaces/{namespace}/application-statuses/{name}"
+        list_url = "/apis/fiaas.schibsted.io/v1/application-statuses"
+        watch_list_url = "/apis/fiaas.schibsted.io/v1/watch/application-statuses"
 
     # Workaround for https://github.com/kubernetes/kubernetes/issues/44182
     apiVersion = Field(str, "fiaas.schibsted.io/v1")
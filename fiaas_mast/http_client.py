@@ -0,0 +1,137 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+from urllib.parse import urlparse
+
+import requests
+from prometheus_client import Counter
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from requests.packages.urllib3.connection import HTTPConnection
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from requests.packages.urllib3.util.retry import Retry
+
+# Key of the shared client in app.extensions
+HTTP_CLIENT = "mast_http_client"
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_KEEPALIVE = 60
+
+RETRY_STATUSES = [requests.codes.too_many_requests,
+                  requests.codes.internal_server_error,
+                  requests.codes.bad_gateway,
+                  requests.codes.service_unavailable,
+                  requests.codes.gateway_timeout]
+
+pool_counter = Counter("http_client_pool_connections", "Connections taken from HTTP client pools, by reuse",
+                       ["client", "result"])
+
+
+def _instrumented_pool(pool_class, client):
+    """Create a subclass of pool_class that counts pooled (hit) and newly opened (miss) connections"""
+    hits = pool_counter.labels(client, "hit")
+    misses = pool_counter.labels(client, "miss")
+
+    class InstrumentedPool(pool_class):
+        def _get_conn(self, timeout=None):
+            conn = super(InstrumentedPool, self)._get_conn(timeout)
+            # Connections that have not been opened yet, or were reset after being dropped, have no socket
+            if conn.sock is None:
+                misses.inc()
+            else:
+                hits.inc()
+            return conn
+
+    return InstrumentedPool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with default timeouts, TCP keep-alive and instrumented connection pools
+
+    :param str client: name used to label the pool metrics
+    :param tuple timeout: (connect, read) timeout used when the caller does not give one
+    :param int keepalive: seconds a connection can be idle before keep-alive probes are sent, 0 to disable
+    """
+
+    def __init__(self, client, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), keepalive=DEFAULT_KEEPALIVE,
+                 **kwargs):
+        self.client = client
+        self.timeout = timeout
+        self.keepalive = keepalive
+        super(PooledHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.keepalive:
+            pool_kwargs["socket_options"] = HTTPConnection.default_socket_options + _keepalive_options(self.keepalive)
+        super(PooledHTTPAdapter, self).init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _instrumented_pool(HTTPConnectionPool, self.client),
+            "https": _instrumented_pool(HTTPSConnectionPool, self.client),
+        }
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super(PooledHTTPAdapter, self).send(request, timeout=timeout, **kwargs)
+
+
+def _keepalive_options(idle):
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    return options
+
+
+def create_http_client(config):
+    """Create the long-lived, thread-safe session used to download configs from Artifactory"""
+    http_client = requests.Session()
+    http_client.auth = ArtifactoryAuth(
+        config['ARTIFACTORY_USER'], config['ARTIFACTORY_PWD'], config['ARTIFACTORY_ORIGIN']
+    )
+
+    retries = Retry(total=10, backoff_factor=1, status_forcelist=RETRY_STATUSES, method_whitelist=False)
+    timeout = (config.get('HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+               config.get('HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+    adapter = PooledHTTPAdapter("artifactory",
+                                timeout=timeout,
+                                keepalive=config.get('HTTP_KEEPALIVE', DEFAULT_KEEPALIVE),
+                                pool_connections=config.get('HTTP_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS),
+                                pool_maxsize=config.get('HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE),
+                                max_retries=retries)
+    http_client.mount('http://', adapter)
+    http_client.mount('https://', adapter)
+
+    return http_client
+
+
+class ArtifactoryAuth(HTTPBasicAuth):
+    def __init__(self, username, password, origin):
+        super(ArtifactoryAuth, self).__init__(username, password)
+        self.origin = origin
+
+    def __call__(self, r):
+        if origin_of(r.url) != self.origin:
+            return r
+
+        return super(ArtifactoryAuth, self).__call__(r)
+
+
+def origin_of(url):
+    parsed_url = urlparse(url)
+    return "{}://{}".format(parsed_url.scheme, parsed_url.netloc)
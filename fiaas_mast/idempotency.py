@@ -0,0 +1,123 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from prometheus_client import Counter
+
+from .common import ClientError
+
+# Key of the shared store in app.extensions
+IDEMPOTENCY_STORE = "mast_idempotency_store"
+
+# Header a client can set to make retries of a deploy return the first result
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+DEFAULT_WINDOW = 600
+DEFAULT_MAX_KEYS = 10000
+
+idempotency_counter = Counter("deploy_idempotency_requests", "Deploys, by whether they repeated an earlier one",
+                              ["result"])
+
+_Entry = namedtuple("_Entry", ["fingerprint", "result", "expires_at"])
+
+
+def fingerprint(namespace, release, config):
+    """Hash of everything that goes into deploying a release, so identical deploys get the same fingerprint"""
+    content = [namespace, release.application_name, release.original_application_name, release.image, config,
+               release.spinnaker_tags, release.raw_tags, release.raw_labels, release.metadata_annotations]
+    data = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore(object):
+    """Remembers the result of each deploy for a window, so a retried deploy returns the first result
+
+    Deploys are identified by the key the client sent, or by their fingerprint when there is none. A key that is
+    sent again with a different release is rejected. The store holds at most max_keys results, dropping the least
+    recently used first.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, max_keys=DEFAULT_MAX_KEYS, clock=time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Locks of keys that are being deployed, with the number of threads using each
+        self._key_locks = {}
+
+    def run(self, key, fingerprint, deploy):
+        """Return the result stored for key, or call deploy() and store its result
+
+        Concurrent calls with the same key wait for each other, so only one of them deploys.
+        """
+        key_lock = self._acquire(key)
+        try:
+            with key_lock:
+                result = self.get(key, fingerprint)
+                if result is None:
+                    result = deploy()
+                    self.put(key, fingerprint, result)
+                return result
+        finally:
+            self._release(key)
+
+    def get(self, key, fingerprint):
+        """Return the result stored for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                idempotency_counter.labels("miss").inc()
+                return None
+            if entry.fingerprint != fingerprint:
+                idempotency_counter.labels("conflict").inc()
+                raise ClientError("{} {} was used for a different deploy".format(IDEMPOTENCY_KEY_HEADER, key))
+            idempotency_counter.labels("hit").inc()
+            self._entries.move_to_end(key)
+            return entry.result
+
+    def put(self, key, fingerprint, result):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(fingerprint, result, self._clock() + self.window)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _acquire(self, key):
+        with self._lock:
+            key_lock, users = self._key_locks.get(key, (None, 0))
+            if key_lock is None:
+                key_lock = threading.Lock()
+            self._key_locks[key] = (key_lock, users + 1)
+            return key_lock
+
+    def _release(self, key):
+        with self._lock:
+            key_lock, users = self._key_locks[key]
+            if users == 1:
+                del self._key_locks[key]
+            else:
+                self._key_locks[key] = (key_lock, users - 1)
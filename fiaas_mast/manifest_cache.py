@@ -0,0 +1,77 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+from prometheus_client import Counter
+
+# Key of the shared cache in app.extensions
+MANIFEST_CACHE = "mast_manifest_cache"
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+manifest_cache_counter = Counter("manifest_cache_requests", "Rendered manifest lookups, by whether they were cached",
+                                 ["result"])
+
+_Entry = namedtuple("_Entry", ["manifest", "size"])
+
+
+class ManifestCache(object):
+    """LRU cache of rendered Application manifests, keyed by the fingerprint of what they were rendered from
+
+    Cached manifests are shared between callers, who must copy any part they change. The cache is bounded by the
+    total size of the manifests as JSON.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                manifest_cache_counter.labels("miss").inc()
+                return None
+            manifest_cache_counter.labels("hit").inc()
+            self._entries.move_to_end(key)
+            return entry.manifest
+
+    def put(self, key, manifest):
+        size = len(json.dumps(manifest, separators=(",", ":")))
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = _Entry(manifest, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
@@ -17,13 +17,19 @@ import yaml
 from k8s.models.common import ObjectMeta
 from requests.exceptions import MissingSchema, InvalidURL, InvalidSchema
 
-from .common import dict_merge, generate_random_uuid_string, ClientError
+from .common import dict_merge, generate_random_uuid_string, ClientError, load_yaml
+from .config_cache import fetch_config
+from .timing import phase
 
 
 class MetadataGenerator:
-    def __init__(self, http_client, create_deployment_id=generate_random_uuid_string):
+    # Label of the phase metrics
+    operation = "generate"
+
+    def __init__(self, http_client, create_deployment_id=generate_random_uuid_string, config_cache=None):
         self.http_client = http_client
         self.create_deployment_id = create_deployment_id
+        self.config_cache = config_cache
 
     def build_annotations(self, items, prefix=""):
         annotations = {}
@@ -71,12 +77,14 @@ class MetadataGenerator:
 
     def download_config(self, config_url):
         try:
-            resp = self.http_client.get(config_url)
+            with phase(self.operation, "download"):
+                return fetch_config(self.http_client, config_url, self.parse_config, self.config_cache)
         except (InvalidURL, MissingSchema, InvalidSchema) as e:
             raise ClientError("Invalid config_url: {}".format(config_url)) from e
-        resp.raise_for_status()
-        try:
-            app_config = yaml.safe_load(resp.text)
-        except yaml.YAMLError as e:
-            raise ClientError("Invalid config YAML: {}".format(e))
-        return app_config
+
+    def parse_config(self, resp):
+        with phase(self.operation, "parse"):
+            try:
+                return load_yaml(resp.content)
+            except yaml.YAMLError as e:
+                raise ClientError("Invalid config YAML: {}".format(e))
@@ -0,0 +1,83 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+from prometheus_client import multiprocess
+
+LOG = logging.getLogger(__name__)
+
+# Directory where prometheus_client keeps metrics shared between worker processes
+MULTIPROC_DIR_ENV = "prometheus_multiproc_dir"
+
+
+class Server(BaseApplication):
+    """Serve mast with gunicorn, using several worker processes that each run several threads
+
+    The Flask app is created inside each worker, so background threads are started after forking.
+    """
+
+    def __init__(self, app_factory, options):
+        self.app_factory = app_factory
+        self.options = options
+        super(Server, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.app_factory()
+
+
+def server_options(config):
+    return {
+        "bind": "0.0.0.0:{}".format(config['PORT']),
+        "worker_class": "gthread",
+        "workers": config['SERVER_WORKERS'],
+        "threads": config['SERVER_THREADS'],
+        "backlog": config['SERVER_BACKLOG'],
+        "keepalive": config['SERVER_KEEPALIVE'],
+        "timeout": config['SERVER_TIMEOUT'],
+        "graceful_timeout": config['SERVER_GRACEFUL_TIMEOUT'],
+        "child_exit": child_exit,
+    }
+
+
+def child_exit(server, worker):
+    if MULTIPROC_DIR_ENV in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def prepare_multiproc_dir():
+    """Create an empty directory for shared metrics, removing anything left by an earlier run
+
+    This must happen before any metrics are created.
+    """
+    path = os.environ.get(MULTIPROC_DIR_ENV)
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for db in glob.glob(os.path.join(path, "*.db")):
+        os.remove(db)
+
+
+def run(app_factory, config):
+    if MULTIPROC_DIR_ENV not in os.environ and config['SERVER_WORKERS'] > 1:
+        LOG.warning("%s is not set, each worker will only report its own metrics", MULTIPROC_DIR_ENV)
+    Server(app_factory, server_options(config)).run()
@@ -0,0 +1,47 @@
+/*
+Copyright 2017-2019 The FIAAS Authors
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+(function () {
+    "use strict";
+
+    var page = document.getElementById("status-page");
+    if (!page || !window.EventSource) {
+        return;
+    }
+    var finished = ["SUCCESS", "FAILED"];
+    var panel = document.getElementById("status-panel");
+    var logs = document.getElementById("logs");
+    var source = new EventSource(page.getAttribute("data-stream-url"));
+
+    source.addEventListener("status", function (event) {
+        var data = JSON.parse(event.data);
+        document.getElementById("status").textContent = data.status;
+        document.getElementById("status-info").textContent = data.info;
+        panel.className = "panel panel-" + data.style;
+        if (finished.indexOf(data.status) >= 0) {
+            source.close();
+        }
+    });
+
+    source.addEventListener("log", function (event) {
+        var placeholder = document.getElementById("no-logs");
+        if (placeholder) {
+            placeholder.parentNode.removeChild(placeholder);
+        }
+        var line = document.createElement("p");
+        line.textContent = JSON.parse(event.data);
+        logs.appendChild(line);
+    });
+})();
@@ -14,25 +14,99 @@
 # limitations under the License.
 
 import logging
+import time
 
 from k8s.client import NotFound
 
 from .fiaas import FiaasStatus, FiaasApplicationStatus
 from .models import Status
+from .status_cache import status_cache
+from .timing import phase
 
 LOGGER = logging.getLogger(__name__)
 
+FINISHED = ("SUCCESS", "FAILED")
+
+
+STATUS_MODELS = (FiaasStatus, FiaasApplicationStatus)
+
 
 def status(namespace, application, deployment_id):
     """Get status of a deployment"""
-    for model in (FiaasStatus, FiaasApplicationStatus):
+    if status_cache.ready:
+        with phase("status", "cache"):
+            s = status_cache.get(namespace, application, deployment_id)
+        return status_from(application, deployment_id, s)
+    for model in STATUS_MODELS:
         try:
-            search_result = model.find(application, namespace, {"fiaas/deployment_id": deployment_id})
-            if len(search_result) > 1:
-                LOGGER.warning("Found %d status objects for deployment ID %s", len(search_result), deployment_id)
-            s = search_result[-1]
-            return Status(status=s.result, info="Deployment of {} is {}".format(application, s.result.lower()),
-                          logs=s.logs)
+            with phase("status", "lookup"):
+                search_result = model.find(application, namespace, {"fiaas/deployment_id": deployment_id})
+            return status_from(application, deployment_id, pick(search_result, deployment_id))
         except (NotFound, IndexError):
             continue
+    return _unknown(deployment_id)
+
+
+def pick(search_result, deployment_id):
+    """Choose the status object to report from the ones found for a deployment
+
+    Raises IndexError when there are none.
+    """
+    if len(search_result) > 1:
+        LOGGER.warning("Found %d status objects for deployment ID %s", len(search_result), deployment_id)
+    return search_result[-1]
+
+
+def status_from(application, deployment_id, s):
+    """Make the Status of a deployment from its status object, which may be None"""
+    return _unknown(deployment_id) if s is None else _from_resource(application, s)
+
+
+def wait_for_change(namespace, application, deployment_id, since, timeout):
+    """Get status of a deployment once it is different from `since`, or after timeout seconds
+
+    Waiting needs the status cache. Until it is ready, the current status is returned straight away.
+    """
+    if not status_cache.ready:
+        return status(namespace, application, deployment_id)
+    s = status_cache.wait(namespace, application, deployment_id, lambda r: _result(r) != since, timeout)
+    return _unknown(deployment_id) if s is None else _from_resource(application, s)
+
+
+def status_updates(namespace, application, deployment_id, timeout):
+    """Yield the status of a deployment, and then each change to its result or logs, until the deployment has
+    finished or timeout seconds have passed
+
+    Updates need the status cache. Until it is ready, only the current status is yielded.
+    """
+    deadline = time.monotonic() + timeout
+    current = status(namespace, application, deployment_id)
+    yield current
+    if not status_cache.ready:
+        return
+    while current.status not in FINISHED:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        seen = (current.status, current.logs)
+        s = status_cache.wait(namespace, application, deployment_id, lambda r: _snapshot(r) != seen, remaining)
+        update = _unknown(deployment_id) if s is None else _from_resource(application, s)
+        if (update.status, update.logs) != seen:
+            current = update
+            yield current
+
+
+def _snapshot(s):
+    return _result(s), [] if s is None else s.logs
+
+
+def _result(s):
+    return "UNKNOWN" if s is None else s.result
+
+
+def _from_resource(application, s):
+    return Status(status=s.result, info="Deployment of {} is {}".format(application, s.result.lower()), logs=s.logs)
+
+
+def _unknown(deployment_id):
     return Status(status="UNKNOWN", info="No status for {} found".format(deployment_id), logs=[])
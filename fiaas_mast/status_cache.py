@@ -0,0 +1,199 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+
+from k8s.base import APIServerError, WatchEvent
+from k8s.client import NotFound
+from prometheus_client import Gauge
+
+from .fiaas import FiaasStatus, FiaasApplicationStatus
+
+LOG = logging.getLogger(__name__)
+
+RETRY_DELAY = 5
+# How long to wait before checking again for a resource the cluster does not have
+MISSING_RETRY_DELAY = 300
+
+last_update_gauge = Gauge("status_cache_last_update_seconds",
+                          "Unix time of the last list, event or bookmark seen by the status cache. "
+                          "The cache is as stale as the time since then.",
+                          ["resource"], multiprocess_mode="liveall")
+
+
+class StatusCache(object):
+    """In-memory index of status objects, kept up to date by watching the apiserver
+
+    Objects are indexed by (namespace, application, deployment_id), taken from the `app` and `fiaas/deployment_id`
+    labels. Each model is listed once, and then watched from the resourceVersion of the list. The cache is ready
+    when every model has been listed.
+    """
+
+    def __init__(self, models=(FiaasStatus, FiaasApplicationStatus)):
+        self._models = models
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._indexes = {model: {} for model in models}
+        self._synced = set()
+        self._stop = threading.Event()
+        self._threads = []
+        self._listeners = set()
+
+    @property
+    def ready(self):
+        return len(self._synced) == len(self._models)
+
+    def get(self, namespace, application, deployment_id):
+        """Return the status object for a deployment, looking in each model in turn, or None if there is none"""
+        with self._lock:
+            return self._lookup((namespace, application, deployment_id))
+
+    def wait(self, namespace, application, deployment_id, changed, timeout):
+        """Wait until changed(resource) is true for the status object of a deployment, or until timeout seconds
+        have passed. The object, or None if there is none, is returned in both cases.
+
+        Waiters are woken by the watch threads whenever the index changes, so nothing is polled.
+        """
+        key = (namespace, application, deployment_id)
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                resource = self._lookup(key)
+                remaining = deadline - time.monotonic()
+                if changed(resource) or remaining <= 0:
+                    return resource
+                self._changed.wait(remaining)
+
+    def subscribe(self, listener):
+        """Call listener() from the watch threads whenever the index changes
+
+        This lets code that cannot block a thread, like coroutines, wait for changes. Listeners must return quickly.
+        """
+        with self._lock:
+            self._listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    def _notify(self):
+        # Called with the lock held
+        self._changed.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def _lookup(self, key):
+        for model in self._models:
+            resource = self._indexes[model].get(key)
+            if resource is not None:
+                return resource
+        return None
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for model in self._models:
+            thread = threading.Thread(target=self._run, args=(model,), name="status-cache-" + model.__name__,
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._threads = []
+
+    def _run(self, model):
+        resource_version = None
+        while not self._stop.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self._relist(model)
+                for event in model.watch_list(resource_version=resource_version, allow_bookmarks=True):
+                    resource_version = event.resource_version
+                    self._handle(model, event)
+                    if self._stop.is_set():
+                        return
+            except NotFound:
+                LOG.info("%s is not available in the cluster", model.__name__)
+                self._replace_index(model, {})
+                resource_version = None
+                self._stop.wait(MISSING_RETRY_DELAY)
+            except APIServerError as e:
+                # 410 Gone means our resourceVersion is too old to resume from
+                if e.api_error["code"] == 410:
+                    LOG.info("%s watch expired, listing again", model.__name__)
+                    resource_version = None
+                else:
+                    LOG.warning("Error watching %s: %s", model.__name__, e)
+                    self._stop.wait(RETRY_DELAY)
+            except Exception:
+                LOG.exception("Error watching %s", model.__name__)
+                self._stop.wait(RETRY_DELAY)
+
+    def _relist(self, model):
+        resp = model._client.get(model._meta.list_url)
+        data = resp.json()
+        index = {}
+        for item in data["items"]:
+            resource = model.from_dict(item)
+            key = _key(resource)
+            if key:
+                index[key] = resource
+        self._replace_index(model, index)
+        return data["metadata"]["resourceVersion"]
+
+    def _replace_index(self, model, index):
+        with self._lock:
+            self._indexes[model] = index
+            self._synced.add(model)
+            self._notify()
+        self._touch(model)
+
+    def _handle(self, model, event):
+        self._touch(model)
+        if not event.has_object():
+            return
+        resource = event.object
+        key = _key(resource)
+        if not key:
+            return
+        with self._lock:
+            index = self._indexes[model]
+            if event.type == WatchEvent.DELETED:
+                current = index.get(key)
+                if current is not None and current.metadata.name == resource.metadata.name:
+                    del index[key]
+            else:
+                index[key] = resource
+            self._notify()
+
+    @staticmethod
+    def _touch(model):
+        last_update_gauge.labels(model.__name__).set(time.time())
+
+
+def _key(resource):
+    labels = resource.metadata.labels or {}
+    application = labels.get("app")
+    deployment_id = labels.get("fiaas/deployment_id")
+    if application is None or deployment_id is None:
+        return None
+    return resource.metadata.namespace, application, deployment_id
+
+
+status_cache = StatusCache()
@@ -0,0 +1,51 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from contextlib import contextmanager
+from timeit import default_timer
+
+from k8s.client import NotFound
+from prometheus_client import Histogram
+
+# From well below a millisecond for cache lookups and parsing, to the tens of seconds a download with retries takes
+BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+phase_histogram = Histogram("phase_latency",
+                            "Latency of the phases of deploy, generate and status operations in seconds. "
+                            "The download phase includes parsing the downloaded config.",
+                            ["operation", "phase", "outcome"], buckets=BUCKETS)
+
+
+@contextmanager
+def phase(operation, name):
+    """Time the block as a phase of operation, labelled with how it ended"""
+    start = default_timer()
+    outcome = "success"
+    try:
+        yield
+    except Exception as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        phase_histogram.labels(operation, name, outcome).observe(max(default_timer() - start, 0))
+
+
+def _outcome(e):
+    if isinstance(e, NotFound):
+        return "not_found"
+    code = getattr(e, "code", None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return "client_error"
+    return "error"
@@ -13,34 +13,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
+import json
+import logging
+import os
+
 from flask import current_app as app
-from flask import url_for, jsonify, request, abort, Blueprint, make_response, render_template
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, Histogram
-from werkzeug.exceptions import UnprocessableEntity
-from requests.auth import HTTPBasicAuth
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from urllib.parse import urlparse
+from flask import url_for, jsonify, request, abort, Blueprint, make_response, render_template, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram
+from prometheus_client import multiprocess
+from werkzeug.exceptions import InternalServerError, UnprocessableEntity
 
 from .application_generator import ApplicationGenerator
-from .common import make_safe_name
+from .common import make_safe_name, parse_duration
+from .config_cache import CONFIG_CACHE
 from .configmap_generator import ConfigMapGenerator
 from .deployer import Deployer
+from .http_client import HTTP_CLIENT
+from .idempotency import IDEMPOTENCY_KEY_HEADER, IDEMPOTENCY_STORE
+from .manifest_cache import MANIFEST_CACHE
 from .models import ApplicationConfiguration
 from .models import Release
-from .status import status
+from .status import status, status_updates, wait_for_change
+
+LOGGER = logging.getLogger(__name__)
 
 web = Blueprint("web", __name__)
 
 request_histogram = Histogram("web_request_latency", "Request latency in seconds", ["page"])
 status_histogram = request_histogram.labels("status")
+status_stream_histogram = request_histogram.labels("status_stream")
 generate_application_histogram = request_histogram.labels("generate_paasbetaapplication")
 generate_configmap_histogram = request_histogram.labels("generate_configmap")
 deploy_histogram = request_histogram.labels("deploy")
+deploy_batch_histogram = request_histogram.labels("deploy_batch")
 metrics_histogram = request_histogram.labels("metrics")
 health_histogram = request_histogram.labels("health")
 
+DEPLOY_FIELDS = ("application_name", "config_url", "image", "namespace")
+DEFAULT_BATCH_DEPLOY_CONCURRENCY = 8
+DEFAULT_STATUS_MAX_WAIT = 60
+DEFAULT_STATUS_STREAM_TIMEOUT = 300
+# How long browsers wait before reconnecting to a status stream, in milliseconds
+STATUS_STREAM_RETRY = 5000
+
 BOOTSTRAP_STATUS = dict(UNKNOWN="warning",
                         SUCCESS="success",
                         RUNNING="info",
@@ -57,34 +72,72 @@ def health_check():
 @deploy_histogram.time()
 def deploy_handler():
     data = request.get_json(force=True)
-    required_fields = ("application_name", "config_url", "image", "namespace")
-    errors = ["Missing key {!r} in input".format(key) for key in required_fields if key not in data]
+    errors = _missing_keys(data, DEPLOY_FIELDS)
     if errors:
         abort(UnprocessableEntity.code, errors)
-    deployer = Deployer(get_http_client())
-    namespace, application_name, deployment_id = deployer.deploy(
-        data["namespace"],
-        Release(
-            data["image"],
-            data["config_url"],
-            make_safe_name(data["application_name"]),
-            data["application_name"],
-            data.get("spinnaker_tags", {}),
-            data.get("raw_tags", {}),
-            data.get("raw_labels", {}),
-            data.get("metadata_annotations", {}))
-    )
-    response = status(namespace, application_name, deployment_id)
-    return jsonify(response._asdict()), 201, {
+    deployer = Deployer(get_http_client(), config_cache=get_config_cache(),
+                        idempotency_store=get_idempotency_store())
+    namespace, application_name, deployment_id, written = deployer.deploy(
+        data["namespace"], _release(data), idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER),
+        force=bool(data.get("force")))
+    response = dict(status(namespace, application_name, deployment_id)._asdict(), written=written)
+    return jsonify(response), 201, {
         "Location": url_for("web.status_handler", _external=True, _scheme=_get_scheme(), namespace=namespace,
                             application=application_name,
                             deployment_id=deployment_id)}
 
 
+@web.route("/deploy/batch", methods=["PUT", "POST"])
+@deploy_batch_histogram.time()
+def deploy_batch_handler():
+    """Deploy several releases concurrently. Each release gets its own result, and a failed release does not stop
+    the others."""
+    data = request.get_json(force=True)
+    items = data.get("releases") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        abort(UnprocessableEntity.code, ["Missing list 'releases' in input"])
+    results = [None] * len(items)
+    positions, deployments = [], []
+    for position, item in enumerate(items):
+        errors = _missing_keys(item, DEPLOY_FIELDS)
+        if errors:
+            results[position] = _batch_error(item, UnprocessableEntity(errors))
+        else:
+            positions.append(position)
+            deployments.append((item["namespace"], _release(item), None, bool(item.get("force"))))
+    if deployments:
+        deployer = Deployer(get_http_client(), config_cache=get_config_cache(),
+                            idempotency_store=get_idempotency_store())
+        outcomes = deployer.deploy_all(deployments, app.config.get('BATCH_DEPLOY_CONCURRENCY',
+                                                                   DEFAULT_BATCH_DEPLOY_CONCURRENCY))
+        for position, outcome in zip(positions, outcomes):
+            if isinstance(outcome, Exception):
+                results[position] = _batch_error(items[position], outcome)
+            else:
+                namespace, application_name, deployment_id, written = outcome
+                results[position] = {
+                    "code": 201,
+                    "namespace": namespace,
+                    "application_name": application_name,
+                    "deployment_id": deployment_id,
+                    "written": written,
+                    "status_url": url_for("web.status_handler", _external=True, _scheme=_get_scheme(),
+                                          namespace=namespace, application=application_name,
+                                          deployment_id=deployment_id),
+                }
+    return jsonify({"results": results}), 200
+
+
 @web.route("/status/<namespace>/<application>/<deployment_id>/", methods=["GET"])
 @status_histogram.time()
 def status_handler(namespace, application, deployment_id):
-    status_object = status(namespace, application, deployment_id)
+    wait = request.args.get("wait")
+    since = request.args.get("since")
+    if wait and since:
+        timeout = min(parse_duration(wait), app.config.get('STATUS_MAX_WAIT', DEFAULT_STATUS_MAX_WAIT))
+        status_object = wait_for_change(namespace, application, deployment_id, since, timeout)
+    else:
+        status_object = status(namespace, application, deployment_id)
     status_url = url_for('web.status_view',
                          _external=True,
                          _scheme=_get_scheme(),
@@ -101,25 +154,17 @@ def status_handler(namespace, application, deployment_id):
 @generate_application_histogram.time()
 def generate_application():
     data = request.get_json(force=True)
-    required_fields = ("application_name", "config_url", "image")
-    errors = ["Missing key {!r} in input".format(key) for key in required_fields if key not in data]
+    errors = _missing_keys(data, ("application_name", "config_url", "image"))
     if errors:
         abort(UnprocessableEntity.code, errors)
-    generator = ApplicationGenerator(get_http_client())
-    deployment_id, application = generator.generate_application(
+    generator = ApplicationGenerator(get_http_client(), config_cache=get_config_cache(),
+                                     manifest_cache=get_manifest_cache())
+    deployment_id, manifest = generator.render(
         data["namespace"],
-        Release(
-            data["image"],
-            data["config_url"],
-            make_safe_name(data["application_name"]),
-            data["application_name"],
-            data.get("spinnaker_tags", {}),
-            data.get("raw_tags", {}),
-            data.get("raw_labels", {}),
-            data.get("metadata_annotations", {}))
+        _release(data)
     )
     return_body = {
-        "manifest": application.as_dict(),
+        "manifest": manifest,
         "deployment_id": deployment_id,
         "status_url": url_for("web.status_handler",
                               _external=True,
@@ -139,7 +184,7 @@ def generate_configmap_application():
     errors = ["Missing key {!r} in input".format(key) for key in required_fields if key not in data]
     if errors:
         abort(UnprocessableEntity.code, errors)
-    generator = ConfigMapGenerator(get_http_client())
+    generator = ConfigMapGenerator(get_http_client(), config_cache=get_config_cache())
 
     deployment_id, config_map = generator.generate_configmap(
         data["namespace"],
@@ -161,7 +206,11 @@ def generate_configmap_application():
 @web.route("/_/metrics")
 @metrics_histogram.time()
 def metrics():
-    resp = make_response(generate_latest())
+    registry = REGISTRY
+    if "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    resp = make_response(generate_latest(registry))
     resp.mimetype = CONTENT_TYPE_LATEST
     return resp
 
@@ -177,42 +226,100 @@ def status_view(namespace, application, deployment_id):
                            deployment_id=deployment_id)
 
 
+@web.route("/status/stream/<namespace>/<application>/<deployment_id>/", methods=["GET"])
+@status_stream_histogram.time()
+def status_stream(namespace, application, deployment_id):
+    """Stream status changes and new log lines as server-sent events
+
+    The id of each event is the number of log lines sent so far. Browsers send it back as Last-Event-ID when they
+    reconnect, and the first page load can pass the lines it already has as ?logs=.
+    """
+    logs_sent = max(_int_or_zero(request.headers.get("Last-Event-ID")), _int_or_zero(request.args.get("logs")))
+    updates = status_updates(namespace, application, deployment_id,
+                             app.config.get('STATUS_STREAM_TIMEOUT', DEFAULT_STATUS_STREAM_TIMEOUT))
+    return Response(_status_events(updates, logs_sent), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _status_events(updates, logs_sent):
+    yield "retry: {}\n\n".format(STATUS_STREAM_RETRY)
+    last_status = None
+    for status_object in updates:
+        for line in status_object.logs[logs_sent:]:
+            logs_sent += 1
+            yield _event("log", line, logs_sent)
+        # Sent after the logs, so clients can stop listening as soon as they see that the deployment has finished
+        if status_object.status != last_status:
+            last_status = status_object.status
+            data = {"status": status_object.status,
+                    "info": status_object.info,
+                    "style": status_bootstrap_filter(status_object.status)}
+            yield _event("status", data, logs_sent)
+
+
+def _event(name, data, event_id):
+    return "event: {}\nid: {}\ndata: {}\n\n".format(name, event_id, json.dumps(data))
+
+
+def _int_or_zero(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
 @web.app_template_filter('status_bootstrap')
 def status_bootstrap_filter(statuz):
     return BOOTSTRAP_STATUS[statuz] if statuz in BOOTSTRAP_STATUS else BOOTSTRAP_STATUS["UNKNOWN"]
 
 
+def _missing_keys(data, required_fields):
+    if not isinstance(data, dict):
+        return ["Input must be an object"]
+    return ["Missing key {!r} in input".format(key) for key in required_fields if key not in data]
+
+
+def _release(data):
+    return Release(
+        data["image"],
+        data["config_url"],
+        make_safe_name(data["application_name"]),
+        data["application_name"],
+        data.get("spinnaker_tags", {}),
+        data.get("raw_tags", {}),
+        data.get("raw_labels", {}),
+        data.get("metadata_annotations", {}))
+
+
+def _batch_error(item, error):
+    """Describe an error in one release of a batch the same way error_handler describes errors of a request"""
+    if not all(hasattr(error, attr) for attr in ("code", "name", "description")):
+        LOGGER.error("Batch deploy of %r failed", item, exc_info=error)
+        error = InternalServerError()
+    return {
+        "code": error.code,
+        "name": error.name,
+        "description": error.description,
+        "application_name": item.get("application_name") if isinstance(item, dict) else None,
+    }
+
+
 def get_http_client():
-    http_client = requests.Session()
-    http_client.auth = ArtifactoryAuth(
-        app.config['ARTIFACTORY_USER'], app.config['ARTIFACTORY_PWD'], app.config['ARTIFACTORY_ORIGIN']
-    )
+    return app.extensions[HTTP_CLIENT]
 
-    retry_statuses = [requests.codes.too_many_requests,
-                      requests.codes.internal_server_error,
-                      requests.codes.bad_gateway,
-                      requests.codes.service_unavailable,
-                      requests.codes.gateway_timeout]
-    retries = Retry(total=10, backoff_factor=1, status_forcelist=retry_statuses, method_whitelist=False)
-    http_client.mount('http://', HTTPAdapter(max_retries=retries))
-    http_client.mount('https://', HTTPAdapter(max_retries=retries))
 
-    return http_client
+def get_config_cache():
+    return app.extensions.get(CONFIG_CACHE)
 
 
-def _get_scheme():
-    return app.config.get('scheme', 'https')
+def get_manifest_cache():
+    return app.extensions.get(MANIFEST_CACHE)
+
 
+def get_idempotency_store():
+    return app.extensions.get(IDEMPOTENCY_STORE)
 
-class ArtifactoryAuth(HTTPBasicAuth):
-    def __init__(self, username, password, origin):
-        super(ArtifactoryAuth, self).__init__(username, password)
-        self.origin = origin
 
-    def __call__(self, r):
-        parsed_url = urlparse(r.url)
-        request_origin = "{}://{}".format(parsed_url.scheme, parsed_url.netloc)
-        if request_origin != self.origin:
-            return r
+def _get_scheme():
+    return app.config.get('scheme', 'https')
 
-        return super(ArtifactoryAuth, self).__call__(r)
@@ -49,6 +49,8 @@ GEN_REQ = [
     "ipaddress==1.0.22",
     "k8s==0.24.2",
     "prometheus_client == 0.7.1",
+    "gunicorn==21.2.0",
+    "aiohttp==3.9.5",
 ]
 
 CODE_QUALITY_REQ = [
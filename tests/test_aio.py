@@ -0,0 +1,345 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+
+import pytest
+from aiohttp import web as aioweb
+from aiohttp.test_utils import TestClient, TestServer
+from k8s import config as k8s_config
+from unittest import mock
+
+from fiaas_mast import aio
+from fiaas_mast.apiserver import JSON_PATCH
+from fiaas_mast.fiaas import FiaasApplication, FiaasApplicationSpec, FiaasApplicationStatus
+from fiaas_mast.status_cache import StatusCache
+
+NAMESPACE = "some-namespace"
+APPLICATION_NAME = "example"
+DEPLOYMENT_ID = "some-id"
+
+CONFIG_YAML = b"""
+version: 3
+replicas: 2
+"""
+
+CONFIGMAP_YAML = b"""
+key: value
+"""
+
+STATUS_URL = "/apis/fiaas.schibsted.io/v1/namespaces/{}/application-statuses/".format(NAMESPACE)
+APPLICATION_URL = "/apis/fiaas.schibsted.io/v1/namespaces/{}/applications/{}".format(NAMESPACE, APPLICATION_NAME)
+
+
+def _status_dict(result, deployment_id=DEPLOYMENT_ID):
+    return {
+        "apiVersion": "fiaas.schibsted.io/v1",
+        "kind": "ApplicationStatus",
+        "metadata": {
+            "name": "{}-{}".format(APPLICATION_NAME, deployment_id),
+            "namespace": NAMESPACE,
+            "labels": {"app": APPLICATION_NAME, "fiaas/deployment_id": deployment_id},
+        },
+        "result": result,
+        "logs": [],
+    }
+
+
+class Backend(object):
+    """Stands in for both Artifactory and the apiserver, and records the requests it gets"""
+
+    def __init__(self):
+        self.requests = []
+        self.applications = {}
+        self.statuses = []
+        self.unavailable = 0
+        self.app = aioweb.Application()
+        self.app.router.add_get("/config.yml", self.config)
+        self.app.router.add_get("/configmap.yml", self.configmap)
+        self.app.router.add_route("*", "/apis/{path:.*}", self.apiserver)
+
+    async def config(self, request):
+        self.requests.append((request.method, request.path, dict(request.headers), None))
+        if self.unavailable:
+            self.unavailable -= 1
+            return aioweb.Response(status=503)
+        return aioweb.Response(body=CONFIG_YAML)
+
+    async def configmap(self, request):
+        return aioweb.Response(body=CONFIGMAP_YAML)
+
+    async def apiserver(self, request):
+        body = await request.json() if request.can_read_body else None
+        self.requests.append((request.method, request.path, dict(request.headers), body))
+        if request.path == STATUS_URL:
+            return aioweb.json_response({"items": self.statuses})
+        if request.method in ("GET", "PATCH"):
+            if request.path not in self.applications:
+                return aioweb.json_response({"code": 404}, status=404)
+            return aioweb.json_response(self.applications[request.path])
+        if request.method == "POST":
+            path = request.path + body["metadata"]["name"]
+            self.applications[path] = body
+            return aioweb.json_response(body, status=201)
+        return aioweb.json_response({"code": 404}, status=404)
+
+
+@pytest.fixture(autouse=True)
+def check_models():
+    types = (FiaasApplication, FiaasApplicationSpec)
+    with mock.patch("fiaas_mast.deployer.check_models", return_value=types), \
+            mock.patch("fiaas_mast.application_generator.check_models", return_value=types):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def status_cache():
+    cache = StatusCache(models=(FiaasApplicationStatus,))
+    with mock.patch("fiaas_mast.aio.status_cache", cache), mock.patch("fiaas_mast.status.status_cache", cache):
+        yield cache
+
+
+@pytest.fixture
+def backend():
+    return Backend()
+
+
+@pytest.fixture
+def run(backend, monkeypatch):
+    """Run test(client, base_url) against an app that talks to the backend"""
+    monkeypatch.setattr(k8s_config, "api_token_source", None)
+    monkeypatch.setattr(aio, "BACKOFF_FACTOR", 0)
+
+    def _run(test):
+        async def _test():
+            async with TestServer(backend.app) as backend_server:
+                base_url = str(backend_server.make_url("")).rstrip("/")
+                config = {
+                    'PORT': 5000,
+                    'APISERVER_TOKEN': "default-token",
+                    'ARTIFACTORY_USER': "default_username",
+                    'ARTIFACTORY_PWD': "default_password",
+                    'ARTIFACTORY_ORIGIN': base_url,
+                    'scheme': "https",
+                }
+                app = aio.create_app(config)
+                monkeypatch.setattr(k8s_config, "api_server", base_url)
+                monkeypatch.setattr(k8s_config, "verify_ssl", False)
+                async with TestClient(TestServer(app)) as client:
+                    await test(client, base_url)
+
+        asyncio.run(_test())
+
+    return _run
+
+
+def _deploy_data(**kwargs):
+    data = {"image": "test_image", "config_url": None, "application_name": APPLICATION_NAME, "namespace": NAMESPACE}
+    data.update(kwargs)
+    return data
+
+
+def test_health(run):
+    async def test(client, base_url):
+        resp = await client.get("/health")
+        assert resp.status == 200
+        assert await resp.json() == "ok"
+        assert resp.headers["X-Frame-Options"] == "DENY"
+
+    run(test)
+
+
+def test_deploy_creates_application_and_reports_status(run, backend):
+    backend.statuses = [_status_dict("RUNNING")]
+
+    locations = []
+
+    async def test(client, base_url):
+        resp = await client.post("/deploy/", json=_deploy_data(config_url=base_url + "/config.yml"))
+        assert resp.status == 201
+        assert await resp.json() == {"status": "RUNNING", "info": "Deployment of example is running", "logs": [],
+                                     "written": True}
+        locations.append(resp.headers["Location"])
+        resp = await client.post("/deploy/", json=_deploy_data(config_url=base_url + "/config.yml"))
+        assert (await resp.json())["written"] is False
+        assert resp.headers["Location"] == locations[0]
+
+    run(test)
+    application = backend.applications[APPLICATION_URL]
+    assert application["spec"]["config"] == {"version": 3, "replicas": 2}
+    deployment_id = application["metadata"]["labels"]["fiaas/deployment_id"]
+    assert application["metadata"]["labels"]["app"] == APPLICATION_NAME
+    assert locations[0].endswith("/status/{}/{}/{}/".format(NAMESPACE, APPLICATION_NAME, deployment_id))
+    method, _, headers, _ = backend.requests[0]
+    assert method == "GET"
+    assert headers["Authorization"].startswith("Basic ")
+    methods = [(method, path) for method, path, _, _ in backend.requests[1:5]]
+    assert methods == [("GET", APPLICATION_URL),
+                       ("POST", APPLICATION_URL[:-len(APPLICATION_NAME)]),
+                       ("GET", STATUS_URL.replace("application-statuses", "statuses")),
+                       ("GET", STATUS_URL)]
+    _, _, headers, _ = backend.requests[1]
+    assert headers["Authorization"] == "Bearer default-token"
+
+
+def test_deploy_patches_existing_application(run, backend):
+    backend.applications[APPLICATION_URL] = {}
+
+    async def test(client, base_url):
+        resp = await client.post("/deploy/", json=_deploy_data(config_url=base_url + "/config.yml"))
+        assert resp.status == 201
+        assert (await resp.json())["status"] == "UNKNOWN"
+
+    run(test)
+    assert [method for method, _, _, _ in backend.requests[:4]] == ["GET", "GET", "PATCH", "GET"]
+    _, _, headers, body = backend.requests[2]
+    assert headers["Content-Type"] == JSON_PATCH
+    assert headers["Authorization"] == "Bearer default-token"
+    assert body[1]["path"] == "/spec"
+    assert body[1]["value"]["config"] == {"version": 3, "replicas": 2}
+
+
+def test_deploy_retries_unavailable_artifactory(run, backend):
+    backend.unavailable = 2
+
+    async def test(client, base_url):
+        resp = await client.post("/deploy/", json=_deploy_data(config_url=base_url + "/config.yml"))
+        assert resp.status == 201
+
+    run(test)
+    assert [path for _, path, _, _ in backend.requests[:3]] == ["/config.yml"] * 3
+
+
+@pytest.mark.parametrize("data,code", (
+    ({"image": "test_image"}, 422),
+    ("not an object", 422),
+))
+def test_deploy_rejects_invalid_input(run, data, code):
+    async def test(client, base_url):
+        resp = await client.post("/deploy/", json=data)
+        assert resp.status == code
+        body = await resp.json()
+        assert body["code"] == code
+        assert all(key in body for key in ("name", "description"))
+
+    run(test)
+
+
+def test_invalid_json_is_bad_request(run):
+    async def test(client, base_url):
+        resp = await client.post("/deploy/", data=b"{")
+        assert resp.status == 400
+
+    run(test)
+
+
+def test_unknown_route_is_json_404(run):
+    async def test(client, base_url):
+        resp = await client.get("/nothing/here")
+        assert resp.status == 404
+        assert (await resp.json())["code"] == 404
+
+    run(test)
+
+
+def test_deploy_batch(run):
+    async def test(client, base_url):
+        resp = await client.post("/deploy/batch", json={"releases": [
+            _deploy_data(config_url=base_url + "/config.yml"),
+            {"image": "test_image"},
+        ]})
+        assert resp.status == 200
+        first, second = (await resp.json())["results"]
+        assert first["code"] == 201
+        assert first["status_url"].startswith("https://")
+        assert second["code"] == 422
+
+    run(test)
+
+
+def test_generate_application(run):
+    async def test(client, base_url):
+        resp = await client.post("/generate/application", json=_deploy_data(config_url=base_url + "/config.yml"))
+        assert resp.status == 200
+        body = await resp.json()
+        assert body["manifest"]["spec"]["config"] == {"version": 3, "replicas": 2}
+        assert body["manifest"]["metadata"]["namespace"] == NAMESPACE
+
+    run(test)
+
+
+def test_generate_configmap(run):
+    async def test(client, base_url):
+        resp = await client.post("/generate/configmap", json={"application_name": APPLICATION_NAME,
+                                                              "application_data_url": base_url + "/configmap.yml",
+                                                              "namespace": NAMESPACE})
+        assert resp.status == 200
+        assert (await resp.json())["manifest"]["data"] == {"key": "value"}
+
+    run(test)
+
+
+def test_invalid_config_url(run):
+    async def test(client, base_url):
+        resp = await client.post("/generate/application", json=_deploy_data(config_url="missing_schema"))
+        assert resp.status == 422
+
+    run(test)
+
+
+def test_status(run, backend):
+    backend.statuses = [_status_dict("SUCCESS")]
+
+    async def test(client, base_url):
+        resp = await client.get("/status/{}/{}/{}/".format(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID))
+        assert resp.status == 200
+        body = await resp.json()
+        assert body["status"] == "SUCCESS"
+        assert body["deployment_status_url"].endswith("/status/view/{}/{}/{}/".format(NAMESPACE, APPLICATION_NAME,
+                                                                                      DEPLOYMENT_ID))
+
+    run(test)
+
+
+def test_status_waits_for_change_in_cache(run, status_cache):
+    status_cache._replace_index(FiaasApplicationStatus, {})
+
+    def deployed():
+        resource = FiaasApplicationStatus.from_dict(_status_dict("SUCCESS"))
+        status_cache._replace_index(FiaasApplicationStatus,
+                                    {(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID): resource})
+
+    async def test(client, base_url):
+        timer = threading.Timer(0.1, deployed)
+        timer.start()
+        resp = await client.get("/status/{}/{}/{}/".format(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID),
+                                params={"wait": "10s", "since": "UNKNOWN"})
+        assert (await resp.json())["status"] == "SUCCESS"
+        timer.join()
+
+    run(test)
+    assert not status_cache._listeners
+
+
+def test_status_wait_times_out(run, status_cache):
+    status_cache._replace_index(FiaasApplicationStatus, {})
+
+    async def test(client, base_url):
+        resp = await client.get("/status/{}/{}/{}/".format(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID),
+                                params={"wait": "0.1", "since": "UNKNOWN"})
+        assert (await resp.json())["status"] == "UNKNOWN"
+
+    run(test)
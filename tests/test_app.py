@@ -42,6 +42,12 @@ class TestApp(object):
         assert config.api_token == token
         assert config.verify_ssl == cert
 
+    def test_apiserver_url_is_configured(self, monkeypatch):
+        monkeypatch.setattr(config, "api_server", config.api_server)
+        create_app(dict(DEFAULT_CONFIG, APISERVER_URL="http://localhost:8001"))
+
+        assert config.api_server == "http://localhost:8001"
+
     @pytest.mark.parametrize("action,code", (
         (lambda c: c.get("/"), 404),
         (lambda c: c.get("/deploy/"), 405),
@@ -65,5 +71,6 @@ class TestApp(object):
         monkeypatch.setenv('ARTIFACTORY_USER', "default_username")
         monkeypatch.setenv('ARTIFACTORY_PWD', "default_password")
         monkeypatch.setenv('ARTIFACTORY_ORIGIN', "https://artifactory.example.com")
+        monkeypatch.setenv('DISCOVERY_REFRESH', "false")
         app = create_app()
         assert app.config['APISERVER_TOKEN'] == token
@@ -16,18 +16,28 @@
 # limitations under the License.
 
 import pytest
+import yaml
 from k8s.client import NotFound
 from unittest.mock import patch
 
-from fiaas_mast.common import check_models, PlatformError
+from fiaas_mast.common import check_models, load_yaml, parse_duration, ClientError, PlatformError
+from fiaas_mast.discovery import ModelRegistry
 from fiaas_mast.fiaas import FiaasApplication, FiaasApplicationSpec
 
 
 class TestSelectModel:
+    @pytest.fixture(autouse=True)
+    def registry(self):
+        with patch('fiaas_mast.common.registry', new=ModelRegistry()) as m:
+            yield m
+
     @pytest.fixture(params=(True, False))
     def crd(self, request):
-        with patch('fiaas_mast.fiaas.FiaasApplication.list') as fm:
-            fm.side_effect = None if request.param else NotFound()
+        with patch('k8s.client.Client.get') as m:
+            if request.param:
+                m.return_value.json.return_value = {"resources": [{"name": "applications"}]}
+            else:
+                m.side_effect = NotFound()
             yield request.param
 
     @staticmethod
@@ -41,3 +51,43 @@ class TestSelectModel:
         actual_app, actual_spec = check_models()
         assert wanted_app == actual_app
         assert wanted_spec == actual_spec
+
+
+class TestLoadYaml:
+    @pytest.fixture(params=(yaml.SafeLoader, getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+    def loader(self, request):
+        with patch('fiaas_mast.common.SafeLoader', new=request.param):
+            yield request.param
+
+    @pytest.mark.usefixtures("loader")
+    @pytest.mark.parametrize("data", (
+        b"version: 3\nports:\n  - target_port: 5000\n",
+        "version: 3\nports:\n  - target_port: 5000\n",
+    ))
+    def test_load_yaml(self, data):
+        assert load_yaml(data) == {"version": 3, "ports": [{"target_port": 5000}]}
+
+    @pytest.mark.usefixtures("loader")
+    def test_load_yaml_is_safe(self):
+        with pytest.raises(yaml.YAMLError):
+            load_yaml("!!python/object/apply:os.system ['true']")
+
+    @pytest.mark.usefixtures("loader")
+    def test_load_empty_yaml(self):
+        assert load_yaml(b"") is None
+
+
+@pytest.mark.parametrize("value,seconds", (
+    ("30", 30),
+    ("30s", 30),
+    ("1.5s", 1.5),
+    ("2m", 120),
+))
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+@pytest.mark.parametrize("value", ("", "s", "soon", "10h"))
+def test_parse_invalid_duration(value):
+    with pytest.raises(ClientError):
+        parse_duration(value)
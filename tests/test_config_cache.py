@@ -0,0 +1,119 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import MagicMock
+
+import pytest
+import yaml
+
+from fiaas_mast.config_cache import ConfigCache, fetch_config
+
+URL = "https://artifactory.example.com/config.yml"
+OTHER_URL = "https://artifactory.example.com/other.yml"
+CONFIG = b"version: 3\nreplicas: 2\n"
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def _response(content=CONFIG, status_code=200, headers=None):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.content = content
+    resp.text = content.decode("utf-8")
+    resp.headers = headers or {}
+    return resp
+
+
+def _parse(resp):
+    return yaml.safe_load(resp.text)
+
+
+class TestConfigCache(object):
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, clock):
+        return ConfigCache(max_bytes=1024, ttl=60, clock=clock)
+
+    @pytest.fixture
+    def http_client(self):
+        http_client = MagicMock()
+        http_client.get.return_value = _response(headers={"ETag": '"abc"', "Last-Modified": "yesterday"})
+        return http_client
+
+    def test_first_download_is_unconditional(self, cache, http_client):
+        assert cache.get(http_client, URL, _parse) == {"version": 3, "replicas": 2}
+        http_client.get.assert_called_once_with(URL)
+
+    def test_not_modified_is_served_from_cache(self, cache, http_client):
+        cache.get(http_client, URL, _parse)
+        http_client.get.return_value = _response(content=b"", status_code=304)
+        parse = MagicMock()
+        assert cache.get(http_client, URL, parse) == {"version": 3, "replicas": 2}
+        http_client.get.assert_called_with(URL, headers={"If-None-Match": '"abc"', "If-Modified-Since": "yesterday"})
+        parse.assert_not_called()
+
+    def test_unchanged_content_is_not_parsed_again(self, cache, http_client):
+        cache.get(http_client, URL, _parse)
+        parse = MagicMock()
+        assert cache.get(http_client, URL, parse) == {"version": 3, "replicas": 2}
+        parse.assert_not_called()
+
+    def test_changed_content_is_parsed(self, cache, http_client):
+        cache.get(http_client, URL, _parse)
+        http_client.get.return_value = _response(content=b"version: 3\nreplicas: 5\n")
+        assert cache.get(http_client, URL, _parse) == {"version": 3, "replicas": 5}
+
+    def test_callers_get_safe_copies(self, cache, http_client):
+        first = cache.get(http_client, URL, _parse)
+        first["replicas"] = 100
+        http_client.get.return_value = _response(content=b"", status_code=304)
+        assert cache.get(http_client, URL, _parse)["replicas"] == 2
+
+    def test_expired_entries_are_downloaded_again(self, cache, http_client, clock):
+        cache.get(http_client, URL, _parse)
+        clock.now = 60
+        cache.get(http_client, URL, _parse)
+        assert http_client.get.call_args_list[-1] == ((URL,),)
+
+    def test_least_recently_used_entries_are_evicted(self, clock, http_client):
+        cache = ConfigCache(max_bytes=len(CONFIG) * 2 - 1, ttl=60, clock=clock)
+        cache.get(http_client, URL, _parse)
+        cache.get(http_client, OTHER_URL, _parse)
+        assert len(cache) == 1
+        assert cache.size == len(CONFIG)
+        cache.get(http_client, URL, _parse)
+        assert http_client.get.call_args_list[-1] == ((URL,),)
+
+    def test_errors_are_not_cached(self, cache, http_client):
+        http_client.get.return_value.raise_for_status.side_effect = Exception("Not Found")
+        with pytest.raises(Exception):
+            cache.get(http_client, URL, _parse)
+        assert len(cache) == 0
+
+
+def test_fetch_config_without_cache():
+    http_client = MagicMock()
+    http_client.get.return_value = _response()
+    assert fetch_config(http_client, URL, _parse) == {"version": 3, "replicas": 2}
+    http_client.get.assert_called_once_with(URL)
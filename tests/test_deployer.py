@@ -15,10 +15,13 @@
 
 import pytest
 import yaml
-from k8s.models.common import ObjectMeta
+from k8s.client import NotFound, ClientError as ApiClientError
+from prometheus_client import REGISTRY
 from unittest.mock import MagicMock, patch
 
-from fiaas_mast.deployer import generate_random_uuid_string, Deployer
+from fiaas_mast.apiserver import FIELD_MANAGER, JSON_PATCH
+from fiaas_mast.deployer import generate_random_uuid_string, Deployer, WRITE_ATTEMPTS
+from fiaas_mast.idempotency import IdempotencyStore
 from fiaas_mast.fiaas import FiaasApplicationSpec, FiaasApplication
 from fiaas_mast.models import Release
 
@@ -84,12 +87,6 @@ config:
   volume: true
 """
 
-VALID_DEPLOY_CONFIG_WITH_INGRESS_1 = """
-version: 3
-ingress:
-  - host: foo.example.com
-"""
-
 VALID_DEPLOY_CONFIG_WITH_INGRESS_2 = """
 version: 3
 """
@@ -101,23 +98,11 @@ class TestCreateDeploymentInK8s(object):
         return FiaasApplication, FiaasApplicationSpec
 
     @pytest.fixture
-    def k8s_model(self, object_types):
-        application_model, _ = object_types
-        application_instance = application_model()
-        application_instance.save = MagicMock()
-        return application_instance
-
-    @pytest.fixture
-    def get(self, k8s_model):
-        with patch('k8s.base.ApiMixIn.get') as m:
-            m.return_value = k8s_model
-            yield m
-
-    @pytest.fixture
-    def get_or_create(self, k8s_model):
-        with patch('k8s.base.ApiMixIn.get_or_create') as m:
-            m.return_value = k8s_model
-            yield m
+    def api_client(self):
+        """An apiserver that has the application with another image"""
+        api_client = MagicMock()
+        api_client.get.side_effect = lambda url: _existing(url.split("/")[-3], image="old_image:1")
+        return api_client
 
     @pytest.fixture(autouse=True)
     def check_models(self, object_types):
@@ -130,81 +115,182 @@ class TestCreateDeploymentInK8s(object):
         (VALID_DEPLOY_CONFIG_WITH_NAMESPACE, ANY_NAMESPACE, "custom-namespace"),
         (VALID_DEPLOY_CONFIG_WITH_NAMESPACE_V3, "target-namespace", "target-namespace"),
     ))
-    def test_deployer_creates_object_of_given_type(self,
-                                                   get,
-                                                   k8s_model,
+    def test_deployer_patches_object_of_given_type(self,
+                                                   api_client,
                                                    object_types,
                                                    config,
                                                    target_namespace,
                                                    expected_namespace):
         http_client = _given_config_url_response_content_is(config)
         _, spec_model = object_types
-        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID)
-        returned_namespace, returned_name, returned_id = deployer.deploy(
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        returned_namespace, returned_name, returned_id, written = deployer.deploy(
             target_namespace=target_namespace,
-            release=Release(
-                VALID_IMAGE_NAME,
-                VALID_DEPLOY_CONFIG_URL,
-                APPLICATION_NAME,
-                APPLICATION_NAME,
-                SPINNAKER_TAGS,
-                RAW_TAGS,
-                RAW_LABELS,
-                ""
-            )
+            release=_release()
         )
 
         assert returned_namespace == expected_namespace
         assert returned_name == APPLICATION_NAME
         assert returned_id == DEPLOYMENT_ID
+        assert written
         http_client.get.assert_called_once_with(VALID_DEPLOY_CONFIG_URL)
 
-        metadata = ObjectMeta(
-            name=APPLICATION_NAME,
-            namespace=expected_namespace,
-            labels={"fiaas/deployment_id": DEPLOYMENT_ID, "app": APPLICATION_NAME}
-        )
         spec = spec_model(
             application=APPLICATION_NAME,
             image=VALID_IMAGE_NAME,
             config=yaml.safe_load(config)
         )
-        get.assert_called_once_with(APPLICATION_NAME, expected_namespace)
-        assert metadata == k8s_model.metadata
-        assert spec == k8s_model.spec
-        k8s_model.save.assert_called_once()
+        api_client.patch.assert_called_once_with(
+            "/apis/fiaas.schibsted.io/v1/namespaces/{}/applications/{}".format(expected_namespace, APPLICATION_NAME),
+            [
+                {"op": "add", "path": "/metadata/labels",
+                 "value": {"fiaas/deployment_id": DEPLOYMENT_ID, "app": APPLICATION_NAME}},
+                {"op": "add", "path": "/spec", "value": spec.as_dict()},
+            ],
+            JSON_PATCH,
+            params={"fieldManager": FIELD_MANAGER}
+        )
+        api_client.post.assert_not_called()
+
+    def test_phases_are_timed(self, api_client):
+        def count(name):
+            labels = {"operation": "deploy", "phase": name, "outcome": "success"}
+            return REGISTRY.get_sample_value("phase_latency_count", labels) or 0
+
+        phases = ("discovery", "download", "parse", "build", "read", "write")
+        before = [count(name) for name in phases]
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert [count(name) for name in phases] == [n + 1 for n in before]
 
-    @pytest.mark.usefixtures("get")
-    def test_ingress_is_updated(self, k8s_model, object_types):
+    def test_repeated_deploy_is_not_written_again(self, api_client):
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        ids = iter(["first", "second"])
+        deployer = Deployer(http_client, create_deployment_id=lambda: next(ids), api_client=api_client,
+                            idempotency_store=IdempotencyStore())
+        first = deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+        second = deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert first == (ANY_NAMESPACE, APPLICATION_NAME, "first", True)
+        assert second == (ANY_NAMESPACE, APPLICATION_NAME, "first", False)
+        assert api_client.patch.call_count == 1
+
+    def test_unchanged_application_is_not_written(self, api_client, object_types):
+        _, spec_model = object_types
+        spec = spec_model(application=APPLICATION_NAME, image=VALID_IMAGE_NAME,
+                          config=yaml.safe_load(VALID_DEPLOY_CONFIG))
+        api_client.get.side_effect = None
+        api_client.get.return_value = _existing(ANY_NAMESPACE, spec=spec.as_dict(), deployment_id="live-id")
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        before = REGISTRY.get_sample_value("deploy_skipped_writes_total") or 0
+
+        result = deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert result == (ANY_NAMESPACE, APPLICATION_NAME, "live-id", False)
+        api_client.patch.assert_not_called()
+        api_client.post.assert_not_called()
+        assert REGISTRY.get_sample_value("deploy_skipped_writes_total") == before + 1
+
+    def test_unchanged_application_is_written_when_forced(self, api_client, object_types):
+        _, spec_model = object_types
+        spec = spec_model(application=APPLICATION_NAME, image=VALID_IMAGE_NAME,
+                          config=yaml.safe_load(VALID_DEPLOY_CONFIG))
+        api_client.get.side_effect = None
+        api_client.get.return_value = _existing(ANY_NAMESPACE, spec=spec.as_dict(), deployment_id="live-id")
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+
+        result = deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release(), force=True)
+
+        assert result == (ANY_NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, True)
+        api_client.patch.assert_called_once()
+
+    def test_spec_is_replaced(self, api_client, object_types):
         _, spec_model = object_types
-        existing_spec = spec_model(
-            application=APPLICATION_NAME,
-            image=VALID_IMAGE_NAME,
-            config=yaml.safe_load(VALID_DEPLOY_CONFIG_WITH_INGRESS_1)
-        )
-        k8s_model.spec = existing_spec
         http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG_WITH_INGRESS_2)
-        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID)
-        deployer.deploy(
-            target_namespace="default",
-            release=Release(
-                VALID_IMAGE_NAME,
-                VALID_DEPLOY_CONFIG_URL,
-                APPLICATION_NAME,
-                APPLICATION_NAME,
-                SPINNAKER_TAGS,
-                RAW_TAGS,
-                RAW_LABELS,
-                ""
-            )
-        )
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        deployer.deploy(target_namespace="default", release=_release())
+
         expected_spec = spec_model(
             application=APPLICATION_NAME,
             image=VALID_IMAGE_NAME,
             config=yaml.safe_load(VALID_DEPLOY_CONFIG_WITH_INGRESS_2)
         )
-        assert k8s_model.spec == expected_spec
-        k8s_model.save.assert_called_once()
+        operations = api_client.patch.call_args[0][1]
+        assert {"op": "add", "path": "/spec", "value": expected_spec.as_dict()} in operations
+
+    def test_creates_object_when_missing(self, api_client):
+        api_client.get.side_effect = NotFound()
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        url, body = api_client.post.call_args[0]
+        assert url == "/apis/fiaas.schibsted.io/v1/namespaces/{}/applications/".format(ANY_NAMESPACE)
+        assert body["metadata"]["name"] == APPLICATION_NAME
+        assert body["metadata"]["labels"] == {"fiaas/deployment_id": DEPLOYMENT_ID, "app": APPLICATION_NAME}
+        assert api_client.post.call_args[1] == {"params": {"fieldManager": FIELD_MANAGER}}
+        api_client.patch.assert_not_called()
+
+    def test_creates_object_when_deleted_while_writing(self, api_client):
+        api_client.patch.side_effect = NotFound()
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert api_client.post.call_count == 1
+
+    def test_retries_update_when_created_concurrently(self, api_client):
+        api_client.get.side_effect = NotFound()
+        api_client.post.side_effect = _conflict()
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert api_client.patch.call_count == 1
+        assert api_client.post.call_count == 1
+
+    def test_gives_up_after_repeated_conflicts(self, api_client):
+        api_client.patch.side_effect = _conflict()
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        with pytest.raises(ApiClientError):
+            deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert api_client.patch.call_count == WRITE_ATTEMPTS
+
+    def test_other_errors_are_not_retried(self, api_client):
+        api_client.patch.side_effect = ApiClientError(response=MagicMock(status_code=422))
+        http_client = _given_config_url_response_content_is(VALID_DEPLOY_CONFIG)
+        deployer = Deployer(http_client, create_deployment_id=lambda: DEPLOYMENT_ID, api_client=api_client)
+        with pytest.raises(ApiClientError):
+            deployer.deploy(target_namespace=ANY_NAMESPACE, release=_release())
+
+        assert api_client.patch.call_count == 1
+
+
+class TestDeployAll(object):
+    @pytest.fixture(autouse=True)
+    def check_models(self):
+        with patch('fiaas_mast.deployer.check_models') as m:
+            m.return_value = (FiaasApplication, FiaasApplicationSpec)
+            yield m
+
+    def test_deploy_all_keeps_order_and_isolates_errors(self):
+        deployer = Deployer(MagicMock())
+        error = Exception("failed")
+
+        def deploy(target_namespace, release):
+            if release == "bad":
+                raise error
+            return target_namespace, release, "id-" + release
+
+        deployer.deploy = deploy
+        results = deployer.deploy_all([("ns", "a"), ("ns", "bad"), ("ns", "c")], max_workers=2)
+        assert results == [("ns", "a", "id-a"), error, ("ns", "c", "id-c")]
 
 
 class TestUUID:
@@ -214,10 +300,38 @@ class TestUUID:
         assert uuid1 != uuid2
 
 
+def _release():
+    return Release(
+        VALID_IMAGE_NAME,
+        VALID_DEPLOY_CONFIG_URL,
+        APPLICATION_NAME,
+        APPLICATION_NAME,
+        SPINNAKER_TAGS,
+        RAW_TAGS,
+        RAW_LABELS,
+        ""
+    )
+
+
+def _existing(namespace, image=VALID_IMAGE_NAME, spec=None, deployment_id="old-id"):
+    resp = MagicMock()
+    resp.json.return_value = {
+        "metadata": {"name": APPLICATION_NAME, "namespace": namespace,
+                     "labels": {"app": APPLICATION_NAME, "fiaas/deployment_id": deployment_id}},
+        "spec": spec or {"application": APPLICATION_NAME, "image": image, "config": {"version": 3}},
+    }
+    return resp
+
+
+def _conflict():
+    return ApiClientError(response=MagicMock(status_code=409))
+
+
 def _given_config_url_response_content_is(config):
     http_client = MagicMock(spec="requests.Session")
     config_response = MagicMock()
     config_response.text = config
+    config_response.content = config.encode("utf-8")
 
     http_client_get = MagicMock()
     http_client_get.return_value = config_response
@@ -0,0 +1,85 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+import pytest
+from k8s.client import NotFound
+
+from fiaas_mast.discovery import ModelRegistry, discovery_counter
+from fiaas_mast.fiaas import FiaasApplication, FiaasApplicationSpec
+
+GROUP_VERSION_URL = "/apis/fiaas.schibsted.io/v1"
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestModelRegistry(object):
+    @pytest.fixture
+    def get(self):
+        with mock.patch("k8s.client.Client.get") as m:
+            m.return_value.json.return_value = {"resources": [{"name": "applications"}, {"name": "statuses"}]}
+            yield m
+
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def registry(self, clock):
+        return ModelRegistry(ttl=60, clock=clock)
+
+    def test_discovers_supported_models(self, registry, get):
+        assert registry.lookup() == (FiaasApplication, FiaasApplicationSpec)
+        get.assert_called_once_with(GROUP_VERSION_URL)
+
+    def test_missing_group_version_is_unsupported(self, registry, get):
+        get.side_effect = NotFound()
+        assert registry.lookup() is None
+
+    def test_missing_resource_is_unsupported(self, registry, get):
+        get.return_value.json.return_value = {"resources": [{"name": "statuses"}]}
+        assert registry.lookup() is None
+
+    def test_result_is_cached_until_ttl_expires(self, registry, get, clock):
+        before = discovery_counter._value.get()
+        registry.lookup()
+        clock.now = 59
+        registry.lookup()
+        assert get.call_count == 1
+        clock.now = 60
+        registry.lookup()
+        assert get.call_count == 2
+        assert discovery_counter._value.get() - before == 2
+
+    def test_background_refresh_resolves_without_lookup(self, registry, get):
+        registry.start()
+        registry.stop()
+        get.assert_called_once_with(GROUP_VERSION_URL)
+        assert registry.lookup() == (FiaasApplication, FiaasApplicationSpec)
+        assert get.call_count == 1
+
+    def test_background_refresh_survives_errors(self, registry, get):
+        get.side_effect = Exception("apiserver is down")
+        registry.start()
+        registry.stop()
+        get.side_effect = None
+        assert registry.lookup() == (FiaasApplication, FiaasApplicationSpec)
@@ -513,6 +513,7 @@ def _given_config_url_response_content_is(config):
     http_client = MagicMock(spec="requests.Session")
     config_response = MagicMock()
     config_response.text = config
+    config_response.content = config.encode("utf-8")
 
     http_client_get = MagicMock()
     http_client_get.return_value = config_response
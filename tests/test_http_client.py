@@ -0,0 +1,103 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from requests.models import Request
+
+from fiaas_mast.http_client import ArtifactoryAuth, PooledHTTPAdapter, create_http_client, pool_counter
+
+CONFIG = {
+    'ARTIFACTORY_USER': "default_username",
+    'ARTIFACTORY_PWD': "default_password",
+    'ARTIFACTORY_ORIGIN': "https://artifactory.example.com",
+    'HTTP_POOL_MAXSIZE': 3,
+    'HTTP_CONNECT_TIMEOUT': 1,
+    'HTTP_READ_TIMEOUT': 2,
+    'HTTP_KEEPALIVE': 30,
+}
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"version: 3\n"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _count(result):
+    return pool_counter.labels("artifactory", result)._value.get()
+
+
+def test_adapter_is_configured_from_config():
+    http_client = create_http_client(CONFIG)
+    adapter = http_client.get_adapter("https://artifactory.example.com")
+    assert isinstance(adapter, PooledHTTPAdapter)
+    assert adapter.timeout == (1, 2)
+    assert adapter._pool_maxsize == 3
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in adapter.poolmanager.connection_pool_kw["socket_options"]
+    assert isinstance(http_client.auth, ArtifactoryAuth)
+
+
+def test_connections_are_reused(server):
+    http_client = create_http_client(CONFIG)
+    hits, misses = _count("hit"), _count("miss")
+    for _ in range(3):
+        resp = http_client.get(server)
+        assert resp.content == b"version: 3\n"
+    assert _count("miss") - misses == 1
+    assert _count("hit") - hits == 2
+
+
+def test_default_timeout_is_used(server, monkeypatch):
+    http_client = create_http_client(CONFIG)
+    sent = {}
+
+    def send(self, request, **kwargs):
+        sent.update(kwargs)
+        raise RuntimeError("stop")
+
+    monkeypatch.setattr("requests.adapters.HTTPAdapter.send", send)
+    with pytest.raises(RuntimeError):
+        http_client.get(server)
+    assert sent["timeout"] == (1, 2)
+
+
+def test_auth_is_only_sent_to_artifactory():
+    http_client = create_http_client(CONFIG)
+    allowed = http_client.auth(Request(url="https://artifactory.example.com/some/path"))
+    assert "Authorization" in allowed.headers
+    disallowed = http_client.auth(Request(url="https://example.com/some/path"))
+    assert "Authorization" not in disallowed.headers
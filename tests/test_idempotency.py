@@ -0,0 +1,119 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import pytest
+
+from fiaas_mast.common import ClientError
+from fiaas_mast.idempotency import IdempotencyStore, fingerprint
+from fiaas_mast.models import Release
+
+RELEASE = Release("image:1", "http://example.com/config.yml", "app", "app", {"pipeline": "p"}, {}, {}, {})
+CONFIG = {"version": 3, "replicas": 2}
+RESULT = ("namespace", "app", "deployment-id")
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFingerprint(object):
+    def test_same_deploy_same_fingerprint(self):
+        assert fingerprint("ns", RELEASE, CONFIG) == fingerprint("ns", RELEASE, dict(CONFIG))
+
+    @pytest.mark.parametrize("namespace,release,config", (
+        ("other", RELEASE, CONFIG),
+        ("ns", RELEASE._replace(image="image:2"), CONFIG),
+        ("ns", RELEASE._replace(spinnaker_tags={"pipeline": "q"}), CONFIG),
+        ("ns", RELEASE, {"version": 3, "replicas": 3}),
+    ))
+    def test_changes_change_fingerprint(self, namespace, release, config):
+        assert fingerprint(namespace, release, config) != fingerprint("ns", RELEASE, CONFIG)
+
+
+class TestIdempotencyStore(object):
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def store(self, clock):
+        return IdempotencyStore(window=60, max_keys=2, clock=clock)
+
+    def test_repeat_returns_first_result(self, store):
+        calls = []
+
+        def deploy():
+            calls.append(1)
+            return RESULT
+
+        assert store.run("key", "fp", deploy) == RESULT
+        assert store.run("key", "fp", deploy) == RESULT
+        assert len(calls) == 1
+
+    def test_failed_deploy_is_not_stored(self, store):
+        def fail():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            store.run("key", "fp", fail)
+        assert store.run("key", "fp", lambda: RESULT) == RESULT
+
+    def test_results_expire_after_window(self, store, clock):
+        store.put("key", "fp", RESULT)
+        clock.now = 61
+        assert store.get("key", "fp") is None
+
+    def test_key_reused_for_other_deploy_is_rejected(self, store):
+        store.put("key", "fp", RESULT)
+        with pytest.raises(ClientError):
+            store.get("key", "other-fp")
+
+    def test_least_recently_used_is_evicted(self, store):
+        store.put("a", "fp", RESULT)
+        store.put("b", "fp", RESULT)
+        store.get("a", "fp")
+        store.put("c", "fp", RESULT)
+        assert len(store) == 2
+        assert store.get("b", "fp") is None
+        assert store.get("a", "fp") == RESULT
+
+    def test_concurrent_repeats_deploy_once(self, store):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def deploy():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return RESULT
+
+        first = threading.Thread(target=lambda: results.append(store.run("key", "fp", deploy)))
+        second = threading.Thread(target=lambda: results.append(store.run("key", "fp", deploy)))
+        first.start()
+        started.wait(5)
+        second.start()
+        release.set()
+        first.join(5)
+        second.join(5)
+        assert results == [RESULT, RESULT]
+        assert len(calls) == 1
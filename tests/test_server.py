@@ -0,0 +1,72 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+import pytest
+
+from fiaas_mast.server import Server, child_exit, prepare_multiproc_dir, server_options
+
+CONFIG = {
+    'PORT': 5000,
+    'SERVER_WORKERS': 4,
+    'SERVER_THREADS': 16,
+    'SERVER_BACKLOG': 1024,
+    'SERVER_KEEPALIVE': 10,
+    'SERVER_TIMEOUT': 60,
+    'SERVER_GRACEFUL_TIMEOUT': 20,
+}
+
+
+def test_gunicorn_is_configured():
+    app = object()
+    server = Server(lambda: app, server_options(CONFIG))
+    assert server.cfg.bind == ["0.0.0.0:5000"]
+    assert server.cfg.worker_class_str == "gthread"
+    assert server.cfg.workers == 4
+    assert server.cfg.threads == 16
+    assert server.cfg.backlog == 1024
+    assert server.cfg.keepalive == 10
+    assert server.cfg.timeout == 60
+    assert server.cfg.graceful_timeout == 20
+    assert server.load() is app
+
+
+@pytest.fixture
+def multiproc_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv("prometheus_multiproc_dir", str(tmpdir.join("metrics")))
+    return tmpdir.join("metrics")
+
+
+def test_prepare_multiproc_dir_removes_old_metrics(multiproc_dir):
+    multiproc_dir.ensure("counter_1234.db")
+    prepare_multiproc_dir()
+    assert multiproc_dir.check(dir=True)
+    assert multiproc_dir.listdir() == []
+
+
+def test_prepare_multiproc_dir_without_multiproc_mode(monkeypatch):
+    monkeypatch.delenv("prometheus_multiproc_dir", raising=False)
+    with mock.patch("os.makedirs") as makedirs:
+        prepare_multiproc_dir()
+        makedirs.assert_not_called()
+
+
+@pytest.mark.usefixtures("multiproc_dir")
+def test_dead_workers_are_marked():
+    worker = mock.Mock(pid=1234)
+    with mock.patch("fiaas_mast.server.multiprocess.mark_process_dead") as mark_process_dead:
+        child_exit(None, worker)
+        mark_process_dead.assert_called_once_with(1234)
@@ -21,7 +21,7 @@ import os.path
 import pytest
 import yaml
 
-from fiaas_mast.status import status
+from fiaas_mast.status import status, status_updates, wait_for_change
 from k8s.client import NotFound
 
 NAMESPACE = "somespace"
@@ -82,3 +82,64 @@ def _setup_response(modifier, get, status_type):
             else:
                 raise NotFound()
         get.side_effect = _get
+
+
+def test_status_is_read_from_ready_cache(get):
+    resource = mock.Mock(result="SUCCESS", logs=["logline 1"])
+    with mock.patch("fiaas_mast.status.status_cache") as cache:
+        cache.ready = True
+        cache.get.return_value = resource
+        result = status(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID)
+        cache.get.assert_called_once_with(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID)
+        assert result.status == "SUCCESS"
+        assert result.logs == ["logline 1"]
+
+        cache.get.return_value = None
+        assert status(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID).status == "UNKNOWN"
+    get.assert_not_called()
+
+
+def test_wait_for_change_uses_cache(get):
+    resource = mock.Mock(result="SUCCESS", logs=[])
+    with mock.patch("fiaas_mast.status.status_cache") as cache:
+        cache.ready = True
+        cache.wait.return_value = resource
+        result = wait_for_change(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, "RUNNING", 30)
+        assert result.status == "SUCCESS"
+        args, _ = cache.wait.call_args
+        assert args[:3] == (NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID)
+        changed = args[3]
+        assert not changed(mock.Mock(result="RUNNING"))
+        assert changed(None)
+    get.assert_not_called()
+
+
+def test_wait_for_change_without_cache_returns_current_status(get, status_type):
+    def modifier(data):
+        data["items"][0]["result"] = "RUNNING"
+
+    _setup_response(modifier, get, status_type)
+    assert wait_for_change(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, "RUNNING", 30).status == "RUNNING"
+
+
+def test_status_updates_follow_cache_until_finished():
+    resources = [mock.Mock(result="RUNNING", logs=["one", "two"]), mock.Mock(result="SUCCESS", logs=["one", "two"])]
+    with mock.patch("fiaas_mast.status.status_cache") as cache:
+        cache.ready = True
+        cache.get.return_value = mock.Mock(result="RUNNING", logs=["one"])
+        cache.wait.side_effect = resources
+        updates = list(status_updates(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, 30))
+    assert [(u.status, u.logs) for u in updates] == [
+        ("RUNNING", ["one"]),
+        ("RUNNING", ["one", "two"]),
+        ("SUCCESS", ["one", "two"]),
+    ]
+
+
+def test_status_updates_without_cache_yields_current_status(get, status_type):
+    def modifier(data):
+        data["items"][0]["result"] = "RUNNING"
+
+    _setup_response(modifier, get, status_type)
+    updates = list(status_updates(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, 30))
+    assert [u.status for u in updates] == ["RUNNING"]
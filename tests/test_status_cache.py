@@ -0,0 +1,167 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from unittest import mock
+
+import pytest
+from k8s.base import APIServerError, WatchBookmark, WatchEvent
+from k8s.client import NotFound
+
+from fiaas_mast.fiaas import FiaasApplicationStatus, FiaasStatus
+from fiaas_mast.status_cache import StatusCache
+
+NAMESPACE = "somespace"
+APPLICATION_NAME = "some-app"
+DEPLOYMENT_ID = "some-id"
+
+
+def _status_dict(name, result, deployment_id=DEPLOYMENT_ID, logs=None, resource_version="1"):
+    return {
+        "apiVersion": "fiaas.schibsted.io/v1",
+        "kind": "ApplicationStatus",
+        "metadata": {
+            "name": name,
+            "namespace": NAMESPACE,
+            "resourceVersion": resource_version,
+            "labels": {"app": APPLICATION_NAME, "fiaas/deployment_id": deployment_id},
+        },
+        "result": result,
+        "logs": logs or [],
+    }
+
+
+def _event(event_type, name, result, **kwargs):
+    return WatchEvent({"type": event_type, "object": _status_dict(name, result, **kwargs)}, FiaasApplicationStatus)
+
+
+@pytest.fixture
+def get():
+    with mock.patch("k8s.client.Client.get") as m:
+        def _get(url, **kwargs):
+            if url == FiaasApplicationStatus._meta.list_url:
+                resp = mock.NonCallableMagicMock()
+                resp.json.return_value = {
+                    "metadata": {"resourceVersion": "10"},
+                    "items": [_status_dict("some-app-some-id", "RUNNING")],
+                }
+                return resp
+            raise NotFound()
+        m.side_effect = _get
+        yield m
+
+
+@pytest.fixture
+def cache():
+    return StatusCache(models=(FiaasApplicationStatus,))
+
+
+def test_not_ready_before_listing(cache):
+    assert not cache.ready
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID) is None
+
+
+@pytest.mark.usefixtures("get")
+def test_relist_builds_index(cache):
+    assert cache._relist(FiaasApplicationStatus) == "10"
+    assert cache.ready
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID).result == "RUNNING"
+    assert cache.get(NAMESPACE, APPLICATION_NAME, "other-id") is None
+
+
+@pytest.mark.usefixtures("get")
+def test_events_update_index(cache):
+    cache._relist(FiaasApplicationStatus)
+    cache._handle(FiaasApplicationStatus, _event(WatchEvent.MODIFIED, "some-app-some-id", "SUCCESS", logs=["done"]))
+    cache._handle(FiaasApplicationStatus, _event(WatchEvent.ADDED, "some-app-new-id", "RUNNING",
+                                                 deployment_id="new-id"))
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID).logs == ["done"]
+    assert cache.get(NAMESPACE, APPLICATION_NAME, "new-id").result == "RUNNING"
+
+    cache._handle(FiaasApplicationStatus, _event(WatchEvent.DELETED, "some-app-some-id", "SUCCESS"))
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID) is None
+
+
+@pytest.mark.usefixtures("get")
+def test_bookmarks_are_ignored(cache):
+    cache._relist(FiaasApplicationStatus)
+    cache._handle(FiaasApplicationStatus, WatchBookmark({"type": "BOOKMARK", "object": {"metadata": {}}}))
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID).result == "RUNNING"
+
+
+@pytest.mark.usefixtures("get")
+def test_legacy_statuses_take_precedence():
+    cache = StatusCache()
+    cache._relist(FiaasApplicationStatus)
+    cache._replace_index(FiaasStatus, {})
+    assert cache.ready
+    legacy = FiaasStatus.from_dict(_status_dict("legacy", "FAILED"))
+    cache._handle(FiaasStatus, WatchEvent({"type": WatchEvent.ADDED, "object": legacy.as_dict()}, FiaasStatus))
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID).result == "FAILED"
+
+
+def test_watch_resumes_and_relists_when_expired(cache, get):
+    expired = APIServerError({"code": 410, "reason": "Expired"})
+    watches = []
+
+    def watch_list(resource_version=None, allow_bookmarks=False):
+        watches.append(resource_version)
+        if len(watches) == 1:
+            yield _event(WatchEvent.MODIFIED, "some-app-some-id", "SUCCESS", resource_version="11")
+        elif len(watches) == 2:
+            raise expired
+        else:
+            cache._stop.set()
+            yield _event(WatchEvent.MODIFIED, "some-app-some-id", "FAILED", resource_version="12")
+
+    with mock.patch.object(FiaasApplicationStatus, "watch_list", side_effect=watch_list):
+        cache._run(FiaasApplicationStatus)
+
+    assert watches == ["10", "11", "10"]
+    assert get.call_count == 2
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID).result == "FAILED"
+
+
+def test_missing_resource_counts_as_synced(get):
+    cache = StatusCache(models=(FiaasStatus,))
+
+    def wait(timeout):
+        cache._stop.set()
+
+    with mock.patch.object(cache._stop, "wait", side_effect=wait):
+        cache._run(FiaasStatus)
+    assert cache.ready
+    assert cache.get(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID) is None
+
+
+@pytest.mark.usefixtures("get")
+def test_wait_returns_when_status_changes(cache):
+    cache._relist(FiaasApplicationStatus)
+
+    def update():
+        cache._handle(FiaasApplicationStatus, _event(WatchEvent.MODIFIED, "some-app-some-id", "SUCCESS"))
+
+    timer = threading.Timer(0.05, update)
+    timer.start()
+    resource = cache.wait(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, lambda r: r.result != "RUNNING", timeout=10)
+    timer.join()
+    assert resource.result == "SUCCESS"
+
+
+@pytest.mark.usefixtures("get")
+def test_wait_times_out(cache):
+    cache._relist(FiaasApplicationStatus)
+    resource = cache.wait(NAMESPACE, APPLICATION_NAME, DEPLOYMENT_ID, lambda r: r.result != "RUNNING", timeout=0.01)
+    assert resource.result == "RUNNING"
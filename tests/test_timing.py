@@ -0,0 +1,46 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from k8s.client import NotFound
+from prometheus_client import REGISTRY
+
+from fiaas_mast.common import ClientError
+from fiaas_mast.timing import phase
+
+
+def _count(operation, name, outcome):
+    labels = {"operation": operation, "phase": name, "outcome": outcome}
+    return REGISTRY.get_sample_value("phase_latency_count", labels) or 0
+
+
+class TestPhase(object):
+    def test_success_is_observed(self):
+        before = _count("test", "success", "success")
+        with phase("test", "success"):
+            pass
+        assert _count("test", "success", "success") == before + 1
+
+    @pytest.mark.parametrize("error,outcome", (
+        (NotFound(), "not_found"),
+        (ClientError("bad config"), "client_error"),
+        (ValueError(), "error"),
+    ))
+    def test_errors_are_observed_and_raised(self, error, outcome):
+        before = _count("test", "failing", outcome)
+        with pytest.raises(type(error)):
+            with phase("test", "failing"):
+                raise error
+        assert _count("test", "failing", outcome) == before + 1
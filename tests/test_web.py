@@ -21,11 +21,13 @@ import pytest
 
 from fiaas_mast.app import create_app
 from fiaas_mast.application_generator import ApplicationGenerator
+from fiaas_mast.common import ClientError
 from fiaas_mast.configmap_generator import ConfigMapGenerator
-from fiaas_mast.deployer import Deployer
+from fiaas_mast.deployer import Deployer, DeployResult
 from fiaas_mast.fiaas import FiaasApplication
 from fiaas_mast.models import Release, Status, ApplicationConfiguration
-from fiaas_mast.web import ArtifactoryAuth, get_http_client
+from fiaas_mast.http_client import ArtifactoryAuth
+from fiaas_mast.web import get_http_client
 import requests
 from requests.models import Request
 
@@ -126,20 +128,74 @@ def test_deploy_invalid_config_url(client, config_url):
 
 
 def test_deploy(client, status):
-    with mock.patch.object(Deployer, 'deploy', return_value=("some-namespace", "app-name", "deploy_id")) as deploy:
+    result = DeployResult("some-namespace", "app-name", "deploy_id", True)
+    with mock.patch.object(Deployer, 'deploy', return_value=result) as deploy:
         resp = client.post("/deploy/", data=dumps(VALID_DEPLOY_DATA), content_type="application/json")
         assert resp.status_code == 201
         assert urlparse(resp.location).path == "/status/some-namespace/app-name/deploy_id/"
 
         body = loads(resp.data.decode(resp.charset))
         assert all(x in body.keys() for x in ("status", "info"))
+        assert body["written"] is True
 
         deploy.assert_called_with(DEFAULT_NAMESPACE,
                                   Release("test_image", "http://example.com", "example", "example", SPINNAKER_TAGS,
-                                          RAW_TAGS, RAW_LABELS, {}))
+                                          RAW_TAGS, RAW_LABELS, {}),
+                                  idempotency_key=None, force=False)
         status.assert_called_with("some-namespace", "app-name", "deploy_id")
 
 
+def test_deploy_passes_idempotency_key(client):
+    result = DeployResult("some-namespace", "app-name", "deploy_id", False)
+    with mock.patch.object(Deployer, 'deploy', return_value=result) as deploy:
+        resp = client.post("/deploy/", data=dumps(dict(VALID_DEPLOY_DATA, force=True)),
+                           content_type="application/json", headers={"Idempotency-Key": "spinnaker-execution-1"})
+        assert resp.status_code == 201
+        assert deploy.call_args[1] == {"idempotency_key": "spinnaker-execution-1", "force": True}
+        assert loads(resp.data.decode(resp.charset))["written"] is False
+
+
+def test_deploy_batch(client):
+    valid = dict(VALID_DEPLOY_DATA, application_name="first_app")
+    failing = dict(VALID_DEPLOY_DATA, application_name="failing")
+    invalid = {"application_name": "invalid"}
+    outcomes = [DeployResult("some-namespace", "first-app", "id-1", True), ClientError("Invalid config_url")]
+    with mock.patch.object(Deployer, 'deploy_all', return_value=outcomes) as deploy_all:
+        resp = client.post("/deploy/batch", data=dumps({"releases": [valid, invalid, failing]}),
+                           content_type="application/json")
+        assert resp.status_code == 200
+        deploy_all.assert_called_once_with([
+            (DEFAULT_NAMESPACE, Release("test_image", "http://example.com", "first-app", "first_app",
+                                        SPINNAKER_TAGS, RAW_TAGS, RAW_LABELS, {}), None, False),
+            (DEFAULT_NAMESPACE, Release("test_image", "http://example.com", "failing", "failing",
+                                        SPINNAKER_TAGS, RAW_TAGS, RAW_LABELS, {}), None, False),
+        ], 8)
+
+    first, second, third = loads(resp.data.decode(resp.charset))["results"]
+    assert first["code"] == 201
+    assert first["deployment_id"] == "id-1"
+    assert urlparse(first["status_url"]).path == "/status/some-namespace/first-app/id-1/"
+    assert second["code"] == 422
+    assert second["application_name"] == "invalid"
+    assert third == {"code": 422, "name": "Unprocessable Entity", "description": "Invalid config_url",
+                     "application_name": "failing"}
+
+
+def test_deploy_batch_hides_unexpected_errors(client):
+    with mock.patch.object(Deployer, 'deploy_all', return_value=[Exception("secret details")]):
+        resp = client.post("/deploy/batch", data=dumps({"releases": [VALID_DEPLOY_DATA]}),
+                           content_type="application/json")
+    result, = loads(resp.data.decode(resp.charset))["results"]
+    assert result["code"] == 500
+    assert "secret details" not in result["description"]
+
+
+@pytest.mark.parametrize("data", ({}, {"releases": "not a list"}, [VALID_DEPLOY_DATA]))
+def test_deploy_batch_invalid_data(client, data):
+    resp = client.post("/deploy/batch", data=dumps(data), content_type="application/json")
+    assert resp.status_code == 422
+
+
 def test_generate_application(client):
     with mock.patch.object(ApplicationGenerator, 'generate_application',
                            return_value=("deployment_id", FiaasApplication())) as generate_application:
@@ -204,6 +260,57 @@ def test_status(client, status):
     assert urlparse(body["deployment_status_url"]).path == "/status/view/test_namespace/test_application/test_id/"
 
 
+@pytest.mark.parametrize("wait,timeout", (
+    ("30s", 30),
+    ("5m", 60),
+))
+def test_status_wait_for_change(client, status, wait, timeout):
+    with mock.patch("fiaas_mast.web.wait_for_change") as wait_for_change:
+        wait_for_change.return_value = Status(status="SUCCESS", info="info", logs=[])
+        resp = client.get("/status/test_namespace/test_application/test_id/?wait={}&since=RUNNING".format(wait))
+        assert resp.status_code == 200
+        assert loads(resp.data.decode(resp.charset))["status"] == "SUCCESS"
+        wait_for_change.assert_called_with("test_namespace", "test_application", "test_id", "RUNNING", timeout)
+        status.assert_not_called()
+
+
+def test_status_wait_invalid_duration(client):
+    resp = client.get("/status/test_namespace/test_application/test_id/?wait=soon&since=RUNNING")
+    assert resp.status_code == 422
+
+
+def test_status_stream(client):
+    updates = [Status(status="RUNNING", info="running", logs=["one"]),
+               Status(status="SUCCESS", info="done", logs=["one", "two", "three"])]
+    with mock.patch("fiaas_mast.web.status_updates", return_value=iter(updates)) as status_updates:
+        resp = client.get("/status/stream/test_namespace/test_application/test_id/",
+                          headers={"Last-Event-ID": "1"})
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/event-stream"
+        events = [event for event in resp.data.decode(resp.charset).split("\n\n") if event]
+        status_updates.assert_called_once_with("test_namespace", "test_application", "test_id", 300)
+    assert events == [
+        "retry: 5000",
+        'event: status\nid: 1\ndata: {"status": "RUNNING", "info": "running", "style": "info"}',
+        'event: log\nid: 2\ndata: "two"',
+        'event: log\nid: 3\ndata: "three"',
+        'event: status\nid: 3\ndata: {"status": "SUCCESS", "info": "done", "style": "success"}',
+    ]
+
+
+def test_status_stream_skips_logs_already_on_page(client):
+    updates = [Status(status="RUNNING", info="running", logs=["one", "two"])]
+    with mock.patch("fiaas_mast.web.status_updates", return_value=iter(updates)):
+        resp = client.get("/status/stream/test_namespace/test_application/test_id/?logs=2")
+        assert '"one"' not in resp.data.decode(resp.charset)
+        assert '"two"' not in resp.data.decode(resp.charset)
+
+
+def test_status_view_links_to_stream(client, status):
+    resp = client.get("/status/view/test_namespace/test_application/test_id/")
+    assert "/status/stream/test_namespace/test_application/test_id/?logs=3" in resp.data.decode(resp.charset)
+
+
 def test_status_view(client, status):
     resp = client.get("/status/view/test_namespace/test_application/test_id/")
     assert resp.status_code == 200
@@ -255,3 +362,23 @@ def test_artifactory_auth_for_disallowed_origin(url):
     input_request = Request(url=url)
     result = auth(input_request)
     assert 'Authorization' not in result.headers
+
+
+def test_http_client_is_shared_by_requests():
+    app = create_app(DEFAULT_CONFIG)
+    with app.app_context():
+        assert get_http_client() is get_http_client()
+
+
+def test_metrics(client):
+    resp = client.get("/_/metrics")
+    assert resp.status_code == 200
+    assert b"web_request_latency" in resp.data
+
+
+def test_metrics_are_collected_from_all_workers(client, tmpdir, monkeypatch):
+    monkeypatch.setenv("prometheus_multiproc_dir", str(tmpdir))
+    with mock.patch("fiaas_mast.web.multiprocess.MultiProcessCollector") as collector:
+        resp = client.get("/_/metrics")
+        assert resp.status_code == 200
+        collector.assert_called_once()